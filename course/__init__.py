@@ -0,0 +1 @@
+"""This package contains the functionality shared across the lectures of the course."""
@@ -0,0 +1,146 @@
+"""This module contains the bootstrap engine for the inference on our estimators.
+
+A statistic maps a matrix of indices of shape (num_batch, num_obs), where each row selects the
+observations of a resample, to the estimates of shape (num_batch,). This way, the statistic can
+process whole batches of resamples at once, e.g. with a batched fit of the propensity score. The
+batches of resamples are drawn from independent children of a np.random.SeedSequence, so the
+results only depend on the seed and not on the number of workers of ``course.parallel.map_tasks``.
+"""
+import functools
+
+import numpy as np
+from scipy import stats
+
+from course.parallel import map_tasks
+from course.rng import get_seed_sequence
+
+# We draw the resamples in batches of this size, which we also distribute across the workers.
+BATCH_SIZE = 50
+
+# We estimate the acceleration of the BCa interval with a jackknife that leaves out one of at most
+# this number of groups of observations at a time.
+JACKKNIFE_GROUPS = 200
+
+
+def get_bootstrap_indices(num_obs, num_batch, seed):
+    """Get the indices of a batch of resamples as a single integer matrix."""
+    return np.random.default_rng(seed).integers(num_obs, size=(num_batch, num_obs))
+
+
+def get_jackknife_indices(order, group_size, start, stop):
+    """Get the indices of the samples that leave out one of the groups start to stop.
+
+    The groups are consecutive blocks of ``group_size`` positions in a permutation of the
+    observations, where any remaining observations at the end are never left out.
+    """
+    positions = np.arange(len(order) - group_size)
+    left_out = np.arange(start, stop)[:, None] * group_size
+    return np.sort(order[positions + group_size * (positions >= left_out)], axis=1)
+
+
+def run_bootstrap_batch(statistic, num_obs, task):
+    """Run a batch of bootstrap replications."""
+    seed, num_batch = task
+    return statistic(get_bootstrap_indices(num_obs, num_batch, seed))
+
+
+def run_jackknife_batch(statistic, order, group_size, task):
+    """Run a batch of jackknife replications."""
+    start, stop = task
+    return statistic(get_jackknife_indices(order, group_size, start, stop))
+
+
+def run_bootstrap(
+    statistic,
+    num_obs,
+    num_replications=1000,
+    seed=None,
+    alpha=0.05,
+    bca=True,
+    num_jobs=1,
+    num_groups=JACKKNIFE_GROUPS,
+):
+    """Run the bootstrap for a statistic.
+
+    The BCa interval requires the jackknife estimate of the acceleration. For up to ``num_groups``
+    observations, we leave out each observation in turn. For larger samples, we leave out one of
+    ``num_groups`` random groups of equal size instead, so the BCa interval costs at most
+    ``num_groups`` evaluations of the statistic on top of the bootstrap replications, independent
+    of the number of observations. Replications with a missing estimate, e.g. as the propensity
+    score is not identified in a resample, are ignored.
+
+    Args:
+        statistic: A function that maps a matrix of indices of shape (num_batch, num_obs) to the
+            estimates of shape (num_batch,).
+        num_obs: An integer with the number of observations.
+        num_replications: An integer with the number of bootstrap replications.
+        seed: An integer or a np.random.SeedSequence, defaults to NumPy's global state.
+        alpha: A float with the significance level of the intervals.
+        bca: A boolean that indicates whether the BCa interval is computed.
+        num_jobs: An integer with the number of worker processes, where zero uses all cores.
+            All replications run in the current process for a single job.
+        num_groups: An integer with the maximum number of groups in the jackknife.
+
+    Returns:
+        A dictionary with the ``estimate`` on the full sample, its bootstrap standard error
+        ``bse``, the ``percentile`` and ``bca`` intervals, and the estimates of all
+        ``replications``.
+    """
+    estimate = statistic(np.arange(num_obs)[None, :])[0]
+
+    sizes = np.diff(np.append(np.arange(0, num_replications, BATCH_SIZE), num_replications))
+    seed = get_seed_sequence(seed)
+    tasks = list(zip(seed.spawn(len(sizes)), sizes))
+    func = functools.partial(run_bootstrap_batch, statistic, num_obs)
+    replications = np.concatenate(map_tasks(func, tasks, num_jobs))
+
+    valid = replications[np.isfinite(replications)]
+    if len(valid) == 0:
+        raise AssertionError("unable to bootstrap, no replication has a valid estimate")
+
+    rslt = dict()
+    rslt["estimate"] = estimate
+    rslt["bse"] = valid.std(ddof=1)
+    rslt["percentile"] = tuple(np.quantile(valid, [alpha / 2, 1 - alpha / 2]).tolist())
+    rslt["bca"] = None
+    rslt["replications"] = replications
+
+    if bca:
+        num_groups = min(num_groups, num_obs)
+        order = np.random.default_rng(seed.spawn(1)[0]).permutation(num_obs)
+        tasks = [
+            (start, min(start + BATCH_SIZE, num_groups))
+            for start in range(0, num_groups, BATCH_SIZE)
+        ]
+        func = functools.partial(run_jackknife_batch, statistic, order, num_obs // num_groups)
+        jackknife = np.concatenate(map_tasks(func, tasks, num_jobs))
+
+        rslt["bca"] = get_bca_interval(estimate, valid, jackknife[np.isfinite(jackknife)], alpha)
+
+    return rslt
+
+
+def get_bca_interval(estimate, replications, jackknife, alpha):
+    """Get the bias-corrected and accelerated (BCa) bootstrap interval.
+
+    Args:
+        estimate: A float with the estimate on the full sample.
+        replications: A numpy array with the bootstrap estimates.
+        jackknife: A numpy array with the jackknife estimates.
+        alpha: A float with the significance level of the interval.
+
+    Returns:
+        A tuple with the lower and upper bound of the interval.
+    """
+    num_below = np.sum(replications < estimate) + 0.5 * np.sum(replications == estimate)
+    bias = stats.norm.ppf(num_below / len(replications))
+
+    deviations = jackknife.mean() - jackknife
+    with np.errstate(divide="ignore", invalid="ignore"):
+        acceleration = np.sum(deviations**3) / (6 * np.sum(deviations**2) ** 1.5)
+    acceleration = np.nan_to_num(acceleration)
+
+    z = stats.norm.ppf([alpha / 2, 1 - alpha / 2])
+    levels = stats.norm.cdf(bias + (bias + z) / (1 - acceleration * (bias + z)))
+
+    return tuple(np.quantile(replications, levels).tolist())
@@ -0,0 +1,58 @@
+"""This module contains the in-memory cache shared by the loaders and fitting layers.
+
+A cache keeps its entries up to a limit on their total size (in bytes) and evicts the least
+recently used ones first. The most recent entry is always kept, even if it exceeds the limit on its
+own. We keep a running total of the sizes, so adding an entry does not require a pass over all the
+others.
+"""
+import collections
+
+
+def get_cache(limit):
+    """Get an empty cache.
+
+    Args:
+        limit: An integer with the maximum total size of the entries (in bytes).
+
+    Returns:
+        A dictionary with the ``limit``, the ``entries`` in the order of their last use, their
+        ``sizes``, and the ``total`` size.
+    """
+    cache = dict()
+    cache["limit"] = limit
+    cache["entries"] = collections.OrderedDict()
+    cache["sizes"] = dict()
+    cache["total"] = 0
+
+    return cache
+
+
+def get_entry(cache, key):
+    """Get an entry of the cache and mark it as the most recently used, or None if missing."""
+    if key not in cache["entries"]:
+        return None
+
+    cache["entries"].move_to_end(key)
+
+    return cache["entries"][key]
+
+
+def add_entry(cache, key, value, size):
+    """Add an entry of a given size (in bytes) to the cache and evict others if necessary."""
+    cache["entries"][key] = value
+    cache["entries"].move_to_end(key)
+    set_entry_size(cache, key, size)
+
+
+def set_entry_size(cache, key, size):
+    """Set the size (in bytes) of an entry, e.g. after it grew, and evict others if necessary."""
+    # The entry might have been evicted in the meantime.
+    if key not in cache["entries"]:
+        return
+
+    cache["total"] += size - cache["sizes"].get(key, 0)
+    cache["sizes"][key] = size
+
+    while len(cache["entries"]) > 1 and cache["total"] > cache["limit"]:
+        key, _ = cache["entries"].popitem(last=False)
+        cache["total"] -= cache["sizes"].pop(key)
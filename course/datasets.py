@@ -0,0 +1,166 @@
+"""This module contains the shared loader for the processed datasets of the course.
+
+The datasets are identified by the textbook and their name, e.g. ``("dehejia_waba",
+"nsw_lalonde")``, and located relative to the project root, so they can be loaded independently
+of the working directory. The notebooks read the compressed parquet files, which preserve the data
+types of the sources, including the labels of categorical variables. Each parquet file records a
+hash of its source and this module in its metadata. If the file is missing or outdated, we build
+it from the tracked source first, so all machines read the same data.
+"""
+import hashlib
+import os
+from itertools import product
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from course.cache import add_entry
+from course.cache import get_cache
+from course.cache import get_entry
+
+DATASETS_ROOT = Path(__file__).resolve().parents[1] / "datasets"
+
+# We keep the loaded datasets in memory up to this limit (in bytes).
+CACHE = get_cache(256 * 1024**2)
+
+OPERATORS = ["==", "!=", "<", "<=", ">", ">=", "in", "not in"]
+
+
+def read_house(fname):
+    """Read the data on the US House elections with more interpretable column names."""
+    df = pd.read_csv(fname, index_col=0)
+    df.rename(columns={"x": "vote_last", "y": "vote_next"}, inplace=True)
+    return df
+
+
+# We map the name of each processed dataset to the source file and the function to read it.
+DATASETS = dict()
+
+# This is a  cross-sectional dataset on low birth weight from the Wooldrige textbook.
+DATASETS["wooldrige/lowbrth"] = ("wooldrige/lowbrth.dta", pd.read_stata)
+
+# Lee (2008), regression discontinuity design, https://rdrr.io/cran/rddtools/man/house.html,
+# required transferred the `rda` file manually to `csv`.
+DATASETS["msc/house"] = ("msc/house.csv", read_house)
+
+# Krueger (1999), STAR experiment, clustering on group level. There was a lot of pre-processing
+# required using the replication material from the MHE website.
+DATASETS["angrist_pischke/webstar"] = ("angrist_pischke/webstar.dta", pd.read_stata)
+
+# Morgan & Winship, these are the datasets for the matching illustration in Chapter 5.
+for num in range(1, 11):
+    DATASETS[f"morgan_winship/mw_cath{num}"] = (f"morgan_winship/mw_cath{num}.dta", pd.read_stata)
+
+# All data related to LaLonde (1986) and Dehejia and Waba (1999) is available on the following
+# NBER website: https://users.nber.org/~rdehejia/nswdata.html. The sample originally used by
+# LaLonde is larger as it does not require information on earnings in 1974, while this is used
+# as a pre-treatment variable in the follow-up work.
+for fname in ["nsw_lalonde", "nsw_dehejia"]:
+    DATASETS[f"dehejia_waba/{fname}"] = (f"dehejia_waba/{fname}.dta", pd.read_stata)
+
+for source, num in product(["psid", "cps"], range(1, 4)):
+    fname = f"{source}_controls{num}"
+    DATASETS[f"dehejia_waba/{fname}"] = (f"dehejia_waba/{fname}.dta", pd.read_stata)
+
+
+def load_dataset(textbook, dataset, columns=None, filters=None):
+    """Load a processed dataset.
+
+    The selection of columns and rows is pushed down to the reader of the parquet file, so only
+    the requested data is read from disk.
+
+    Args:
+        textbook: a string with the textbook, e.g. "dehejia_waba"
+        dataset: a string with the name of the dataset, e.g. "nsw_lalonde"
+        columns: a list with the columns to load, defaults to all columns
+        filters: a list of tuples (column, operator, value) that all rows satisfy, where the
+            operator is one of "==", "!=", "<", "<=", ">", ">=", "in", "not in"
+
+    Returns:
+        A DataFrame with the requested data.
+    """
+    fname = get_dataset_path(textbook, dataset)
+
+    key = (fname, os.stat(fname).st_mtime_ns, repr(columns), repr(filters))
+    df = get_entry(CACHE, key)
+    if df is None:
+        df = read_dataset(fname, columns, filters)
+        add_entry(CACHE, key, df, df.memory_usage(deep=True).sum())
+
+    # We do not want changes by the caller to spill over to the next call.
+    return df.copy()
+
+
+def get_dataset_path(textbook, dataset):
+    """Get the path of the parquet file of the processed dataset, which is built if outdated."""
+    name = f"{textbook}/{dataset}"
+    if name not in DATASETS:
+        raise AssertionError(f"unable to find dataset {name}")
+
+    fname = DATASETS_ROOT / "processed" / f"{name}.parquet"
+    if not is_dataset_current(name):
+        write_dataset(name, read_source(name))
+
+    return fname
+
+
+def get_source_path(name):
+    """Get the path of the source of a dataset."""
+    return DATASETS_ROOT / "sources" / DATASETS[name][0]
+
+
+def get_source_hash(name):
+    """Get a hash of the dataset's source and this module, which processes it."""
+    hash_ = hashlib.sha256()
+    for fname in [get_source_path(name), Path(__file__).resolve()]:
+        with open(fname, "rb") as infile:
+            hash_.update(infile.read())
+
+    return hash_.hexdigest()
+
+
+def is_dataset_current(name):
+    """Check whether the parquet file of a dataset exists and was built from its current source."""
+    fname = DATASETS_ROOT / "processed" / f"{name}.parquet"
+    if not fname.exists():
+        return False
+
+    metadata = pq.read_schema(fname).metadata or dict()
+    return metadata.get(b"source_hash", b"").decode() == get_source_hash(name)
+
+
+def read_source(name):
+    """Read the source of a dataset."""
+    return DATASETS[name][1](get_source_path(name))
+
+
+def write_dataset(name, df):
+    """Write the parquet file of a dataset together with the hash of its source.
+
+    We write to a temporary file first, so concurrent readers never see a partial file.
+    """
+    fname = DATASETS_ROOT / "processed" / f"{name}.parquet"
+    os.makedirs(fname.parent, exist_ok=True)
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    metadata = dict(table.schema.metadata or dict())
+    metadata[b"source_hash"] = get_source_hash(name).encode()
+    table = table.replace_schema_metadata(metadata)
+
+    fname_tmp = fname.with_name(f"{fname.name}.{os.getpid()}.tmp")
+    pq.write_table(table, fname_tmp, compression="snappy")
+    os.replace(fname_tmp, fname)
+
+
+def read_dataset(fname, columns, filters):
+    """Read the requested columns and rows of a dataset from disk."""
+    filters = filters or list()
+    for _, operator, _ in filters:
+        if operator not in OPERATORS:
+            raise NotImplementedError
+
+    df = pd.read_parquet(fname, columns=columns, filters=filters or None)
+
+    return df.reset_index(drop=True)
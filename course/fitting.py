@@ -0,0 +1,178 @@
+"""This module contains a fitting layer for repeated OLS regressions on the same data.
+
+Parsing the formula and building the design matrices often dominates the runtime of a fit. We keep
+the design matrices for each combination of formula and data in memory. The key only hashes the
+columns of the data the formula refers to, so a lookup is cheap for wide frames. The QR
+factorization of the regressors, which all outputs share, is cached separately and keyed on the
+regressors themselves, so formulas that only differ in the outcome share it. Only the requested
+outputs are computed, and repeated requests are returned from the cache.
+"""
+import hashlib
+import re
+
+import numpy as np
+import pandas as pd
+import patsy
+from scipy.linalg import solve_triangular
+
+from course.cache import add_entry
+from course.cache import get_cache
+from course.cache import get_entry
+from course.cache import set_entry_size
+
+# We keep the designs and factorizations in memory up to this limit (in bytes).
+CACHE = get_cache(256 * 1024**2)
+
+# We find the names of the variables in a formula among its identifiers and quoted strings, e.g.
+# for ``Q("name with spaces")``.
+NAME_PATTERN = re.compile(r"[A-Za-z_]\w*|\"[^\"]*\"|'[^']*'")
+
+OUTPUTS = ["params", "bse", "fittedvalues", "resid"]
+
+
+def get_frame_hash(data, formula=None):
+    """Get a hash of the content of a dataframe, including its index and column labels.
+
+    For a formula, we only hash the columns that the formula refers to, as all others do not
+    affect the design matrices.
+    """
+    if formula is not None:
+        names = {name.strip("\"'") for name in NAME_PATTERN.findall(formula)}
+        data = data[[column for column in data.columns if column in names]]
+
+    values = pd.util.hash_pandas_object(data, index=True).to_numpy()
+    return hashlib.sha256(values.tobytes() + repr(list(data.columns)).encode()).hexdigest()
+
+
+def get_array_hash(array):
+    """Get a hash of the content and shape of an array."""
+    array = np.ascontiguousarray(array)
+    return hashlib.sha256(array.tobytes() + repr(array.shape).encode()).hexdigest()
+
+
+def get_design(formula, data):
+    """Get the design matrices for a formula and the data.
+
+    Args:
+        formula: A string with the formula in the patsy syntax.
+        data: A dataframe with the variables in the formula.
+
+    Returns:
+        A dictionary with the outcome ``endog``, the regressors ``exog`` and their ``labels``, the
+        ``index`` of the rows without missing values, the outputs computed so far, and the ``key``
+        in the cache.
+    """
+    key = (formula, get_frame_hash(data, formula))
+
+    design = get_entry(CACHE, key)
+    if design is not None:
+        return design
+
+    endog, exog = patsy.dmatrices(formula, data, return_type="dataframe")
+
+    design = dict()
+    design["endog"] = endog.iloc[:, 0].to_numpy(dtype=float)
+    design["exog"] = exog.to_numpy(dtype=float)
+    design["labels"] = list(exog.columns)
+    design["index"] = exog.index
+    design["outputs"] = dict()
+    design["key"] = key
+    design["exog_key"] = ("qr", get_array_hash(design["exog"]))
+
+    add_entry(CACHE, key, design, get_design_size(design))
+
+    return design
+
+
+def get_design_size(design):
+    """Get the size of the arrays in a design (in bytes)."""
+    arrays = [design["endog"], design["exog"]]
+    arrays += [value for value in design["outputs"].values() if isinstance(value, np.ndarray)]
+    return sum(array.nbytes for array in arrays)
+
+
+def get_factorization(design):
+    """Get the QR factorization of the regressors and the projection of the outcome.
+
+    The factorization is shared by all designs with the same regressors, while the projection is
+    specific to the outcome of each design.
+    """
+    factorization = get_entry(CACHE, design["exog_key"])
+
+    if factorization is None:
+        q, r = np.linalg.qr(design["exog"])
+
+        if np.any(np.abs(np.diag(r)) < 1e-10 * np.abs(r).max()):
+            raise AssertionError("unable to fit, regressors are linearly dependent")
+
+        factorization = (q, r)
+        add_entry(CACHE, design["exog_key"], factorization, q.nbytes + r.nbytes)
+
+    q, r = factorization
+
+    outputs = design["outputs"]
+    if "qty" not in outputs:
+        outputs["qty"] = q.T @ design["endog"]
+        set_entry_size(CACHE, design["key"], get_design_size(design))
+
+    return q, r, outputs["qty"]
+
+
+def get_output(design, output):
+    """Get an output of the OLS regression for a design."""
+    outputs = design["outputs"]
+
+    if output in outputs:
+        return outputs[output]
+
+    q, r, qty = get_factorization(design)
+
+    if output == "params":
+        rslt = solve_triangular(r, qty)
+    elif output == "fittedvalues":
+        rslt = q @ qty
+    elif output == "resid":
+        rslt = design["endog"] - get_output(design, "fittedvalues")
+    elif output == "bse":
+        resid = get_output(design, "resid")
+        sigma2 = resid @ resid / (len(resid) - r.shape[1])
+        r_inv = solve_triangular(r, np.eye(r.shape[1]))
+        rslt = np.sqrt((r_inv**2).sum(axis=1) * sigma2)
+    else:
+        raise NotImplementedError
+
+    outputs[output] = rslt
+    set_entry_size(CACHE, design["key"], get_design_size(design))
+
+    return rslt
+
+
+def fit_ols(formula, data, outputs=("params",)):
+    """Fit an OLS regression and compute the requested outputs only.
+
+    Args:
+        formula: A string with the formula in the patsy syntax.
+        data: A dataframe with the variables in the formula.
+        outputs: An iterable with the requested outputs, which are named after the attributes of
+            the statsmodels results: ``params``, ``bse``, ``fittedvalues``, and ``resid``.
+
+    Returns:
+        A dictionary with a series for each requested output, indexed by the labels of the
+        regressors or the rows of the data.
+    """
+    design = get_design(formula, data)
+
+    rslt = dict()
+    for output in outputs:
+        if output not in OUTPUTS:
+            raise NotImplementedError
+
+        if output in ["params", "bse"]:
+            index = design["labels"]
+        else:
+            index = design["index"]
+
+        # We do not want changes by the caller to spill over to the cached outputs.
+        rslt[output] = pd.Series(get_output(design, output).copy(), index=index, name=output)
+
+    return rslt
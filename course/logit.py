@@ -0,0 +1,69 @@
+"""This module contains a lean logit estimator for the propensity scores.
+
+We maximize the likelihood with Newton's method, which for the logit model coincides with
+iteratively reweighted least squares. All leading axes of the data are treated as a batch of
+independent samples of equal size, e.g. bootstrap resamples or several datasets of the same
+design, which are fitted at once.
+"""
+import numpy as np
+from scipy.special import expit
+
+
+def fit_logit(endog, exog, start_params=None, predictions_only=False, tol=1e-10, max_iter=100):
+    """Fit a logit model.
+
+    Args:
+        endog: A numpy array with the binary outcome of shape (..., num_obs).
+        exog: A numpy array with the regressors of shape (..., num_obs, num_regressors).
+        start_params: A numpy array with the starting values of shape (..., num_regressors),
+            which is broadcast against the batch, e.g. the estimates on the full sample as a
+            warm start for the bootstrap resamples. Defaults to zeros.
+        predictions_only: A boolean that indicates whether only the predicted probabilities are
+            returned.
+        tol: A float with the convergence tolerance for the Newton steps.
+        max_iter: An integer with the maximum number of iterations.
+
+    Returns:
+        A numpy array with the predicted probabilities of shape (..., num_obs) or a dictionary
+        with the coefficients ``params``, their standard errors ``bse``, and the predicted
+        probabilities ``predict``.
+    """
+    endog, exog = np.asarray(endog, dtype=float), np.asarray(exog, dtype=float)
+    exog_t = np.swapaxes(exog, -1, -2)
+
+    shape = exog.shape[:-2] + exog.shape[-1:]
+    if start_params is None:
+        params = np.zeros(shape)
+    else:
+        params = np.broadcast_to(np.asarray(start_params, dtype=float), shape).copy()
+
+    for _ in range(max_iter):
+        prob = expit((exog @ params[..., None])[..., 0])
+        score = (exog_t @ (endog - prob)[..., None])[..., 0]
+        hessian = exog_t @ (exog * (prob * (1 - prob))[..., None])
+
+        # The Hessian becomes singular if the outcome is (quasi-)perfectly separated.
+        try:
+            step = np.linalg.solve(hessian, score[..., None])[..., 0]
+        except np.linalg.LinAlgError:
+            raise AssertionError("unable to fit logit, Hessian is singular")
+        params += step
+
+        if np.all(np.abs(step) < tol):
+            break
+    else:
+        raise AssertionError("unable to fit logit, Newton's method did not converge")
+
+    prob = expit((exog @ params[..., None])[..., 0])
+
+    if predictions_only:
+        return prob
+
+    hessian = exog_t @ (exog * (prob * (1 - prob))[..., None])
+
+    rslt = dict()
+    rslt["params"] = params
+    rslt["bse"] = np.sqrt(np.diagonal(np.linalg.inv(hessian), axis1=-2, axis2=-1))
+    rslt["predict"] = prob
+
+    return rslt
@@ -0,0 +1,396 @@
+"""This module contains the matching estimators for the average treatment effects.
+
+For matching on a score, we sort the scores of the potential matches once and then find the
+nearest neighbors of each unit by a binary search. For matching on the covariates, we whiten them,
+so the Euclidean distance corresponds to the Mahalanobis distance, and index the potential matches
+with a KD-tree. In both cases, there is no need to compute the distances between all pairs of
+treated and control units.
+"""
+import numpy as np
+from scipy.linalg import solve_triangular
+from scipy.spatial import cKDTree
+
+from course.logit import fit_logit
+
+ESTIMANDS = ["ATT", "ATC", "ATE"]
+
+
+def get_neighbors(score, score_pool, num_neighbors=1, caliper=None, replacement=True):
+    """Get the nearest neighbors by the score.
+
+    Without replacement, we match greedily and start with the units with the highest scores, so
+    each unit in the pool is used at most once.
+
+    Args:
+        score: A numpy array with the scores of the units to be matched.
+        score_pool: A numpy array with the scores of the potential matches.
+        num_neighbors: An integer with the number of neighbors for each unit.
+        caliper: A float with the maximum distance between a unit and its neighbors, defaults to
+            no restriction.
+        replacement: A boolean that indicates whether units in the pool can be matched
+            repeatedly.
+
+    Returns:
+        A numpy array of shape (num_units, num_neighbors) with the positions of the neighbors in
+        the pool, ordered by their distance, and -1 where no neighbor is found.
+    """
+    score, score_pool = np.asarray(score, dtype=float), np.asarray(score_pool, dtype=float)
+
+    if len(score_pool) == 0:
+        return np.full((len(score), num_neighbors), -1)
+
+    order = np.argsort(score_pool, kind="stable")
+    sorted_pool = score_pool[order]
+    positions = np.searchsorted(sorted_pool, score)
+
+    if replacement:
+        neighbors = get_neighbors_with_replacement(score, sorted_pool, positions, num_neighbors)
+    else:
+        neighbors = get_neighbors_without_replacement(
+            score, sorted_pool, positions, num_neighbors, caliper
+        )
+
+    # We map the positions in the sorted pool back to the original ones.
+    is_found = neighbors >= 0
+    if caliper is not None:
+        distance = np.abs(sorted_pool[np.where(is_found, neighbors, 0)] - score[:, None])
+        is_found &= distance <= caliper
+
+    neighbors = np.where(is_found, order[np.where(is_found, neighbors, 0)], -1)
+
+    return neighbors
+
+
+def get_neighbors_with_replacement(score, sorted_pool, positions, num_neighbors):
+    """Get the nearest neighbors when the units in the pool can be matched repeatedly.
+
+    The nearest neighbors are among the closest candidates on both sides of the position of each
+    unit in the sorted pool, so we only compare those.
+    """
+    num_pool = len(sorted_pool)
+
+    candidates = positions[:, None] + np.arange(-num_neighbors, num_neighbors)
+    is_valid = (candidates >= 0) & (candidates < num_pool)
+    candidates = np.clip(candidates, 0, num_pool - 1)
+
+    distance = np.where(is_valid, np.abs(sorted_pool[candidates] - score[:, None]), np.inf)
+
+    idx = np.argsort(distance, axis=1, kind="stable")[:, :num_neighbors]
+    neighbors = np.take_along_axis(candidates, idx, axis=1)
+    neighbors[np.isinf(np.take_along_axis(distance, idx, axis=1))] = -1
+
+    return neighbors
+
+
+def get_neighbors_without_replacement(score, sorted_pool, positions, num_neighbors, caliper=None):
+    """Get the nearest neighbors when each unit in the pool can only be matched once.
+
+    We keep track of the next available unit in the sorted pool on either side with two disjoint
+    sets, so finding the nearest available unit does not require a scan over the used ones. A unit
+    in the pool outside the caliper remains available for the units matched later.
+    """
+    num_pool = len(sorted_pool)
+
+    # The next available position at or above a position, where the end serves as a sentinel.
+    above = list(range(num_pool + 1))
+    # The next available position at or below a position, shifted by one for the sentinel.
+    below = list(range(num_pool + 1))
+
+    # We work with lists in the loop, as the access to single elements is much faster.
+    order = np.argsort(-score, kind="stable").tolist()
+    score, sorted_pool, positions = score.tolist(), sorted_pool.tolist(), positions.tolist()
+
+    neighbors = np.full((len(score), num_neighbors), -1)
+    for i in order:
+        for j in range(num_neighbors):
+            upper = find_root(above, positions[i])
+            lower = find_root(below, positions[i]) - 1
+
+            if upper == num_pool and lower == -1:
+                return neighbors
+
+            if lower == -1:
+                match = upper
+            elif upper == num_pool:
+                match = lower
+            elif sorted_pool[upper] - score[i] < score[i] - sorted_pool[lower]:
+                match = upper
+            else:
+                match = lower
+
+            if caliper is not None and abs(sorted_pool[match] - score[i]) > caliper:
+                break
+
+            neighbors[i, j] = match
+            above[match], below[match + 1] = match + 1, match
+
+    return neighbors
+
+
+def find_root(parent, i):
+    """Find the root of an element in a disjoint set, while halving the paths along the way."""
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def get_matching_estimate(
+    y, d, score, estimand="ATT", num_neighbors=1, caliper=None, replacement=True
+):
+    """Get the matching estimate of an average treatment effect.
+
+    We impute the missing potential outcome of each unit by the average outcome of its nearest
+    neighbors in the other treatment group. Units without any neighbor within the caliper are
+    dropped.
+
+    Args:
+        y: A numpy array with the observed outcomes.
+        d: A numpy array with the treatment indicators.
+        score: A numpy array with the scores used for matching, e.g. the propensity scores.
+        estimand: A string with the estimand, which is one of "ATT", "ATC", or "ATE".
+        num_neighbors: An integer with the number of neighbors for each unit.
+        caliper: A float with the maximum distance between a unit and its neighbors, defaults to
+            no restriction.
+        replacement: A boolean that indicates whether units can be matched repeatedly.
+
+    Returns:
+        A float with the estimate.
+    """
+    if estimand not in ESTIMANDS:
+        raise NotImplementedError
+
+    y, score = np.asarray(y, dtype=float), np.asarray(score, dtype=float)
+    is_treated = np.asarray(d) == 1
+
+    if is_treated.all() or not is_treated.any():
+        raise AssertionError("unable to match, both treatment groups need to be observed")
+
+    groups = list()
+    if estimand in ["ATT", "ATE"]:
+        groups.append((is_treated, 1))
+    if estimand in ["ATC", "ATE"]:
+        groups.append((~is_treated, -1))
+
+    effects = list()
+    for is_group, sign in groups:
+        neighbors = get_neighbors(
+            score[is_group], score[~is_group], num_neighbors, caliper, replacement
+        )
+        effects.append(sign * (y[is_group] - get_neighbor_means(y[~is_group], neighbors)))
+
+    effects = np.concatenate(effects)
+    effects = effects[~np.isnan(effects)]
+
+    if len(effects) == 0:
+        raise AssertionError("unable to match, no unit has a neighbor within the caliper")
+
+    return effects.mean()
+
+
+def get_propensity_matching_estimates(y, d, exog, start_params, indices, estimand="ATT", **kwargs):
+    """Get the propensity score matching estimates for a batch of samples.
+
+    We fit the propensity scores of all samples at once, starting from the estimates on the full
+    data, which the caller computes once. If the propensity score is not identified in one of the
+    samples, we fall back to separate fits, and its estimate is missing. This function serves as
+    the statistic for the bootstrap, e.g. ``functools.partial(get_propensity_matching_estimates,
+    y, d, exog, fit_logit(d, exog)["params"])``.
+
+    Args:
+        y: A numpy array with the observed outcomes.
+        d: A numpy array with the treatment indicators.
+        exog: A numpy array with the regressors of the propensity score.
+        start_params: A numpy array with the coefficients of the propensity score on the full
+            data, which serve as the starting values of the fits.
+        indices: A numpy array of shape (num_batch, num_obs) with the observations of each
+            sample.
+        estimand: A string with the estimand, which is one of "ATT", "ATC", or "ATE".
+        kwargs: Further arguments passed to ``get_matching_estimate``.
+
+    Returns:
+        A numpy array with the estimates for each sample.
+    """
+    y, d, exog = np.asarray(y), np.asarray(d), np.asarray(exog)
+
+    try:
+        scores = fit_logit(d[indices], exog[indices], start_params, predictions_only=True)
+    except AssertionError:
+        scores = list()
+        for idx in indices:
+            try:
+                scores.append(fit_logit(d[idx], exog[idx], start_params, predictions_only=True))
+            except AssertionError:
+                scores.append(None)
+
+    estimates = np.full(len(indices), np.nan)
+    for i, (idx, score) in enumerate(zip(indices, scores)):
+        if score is None:
+            continue
+        try:
+            estimates[i] = get_matching_estimate(y[idx], d[idx], score, estimand, **kwargs)
+        except AssertionError:
+            continue
+
+    return estimates
+
+
+def get_neighbor_means(y_pool, neighbors):
+    """Get the average outcome of the neighbors, which is missing for units without neighbors."""
+    is_found = neighbors >= 0
+    values = np.where(is_found, y_pool[np.where(is_found, neighbors, 0)], 0.0)
+
+    with np.errstate(invalid="ignore"):
+        return values.sum(axis=1) / is_found.sum(axis=1)
+
+
+def get_cholesky_factor(x):
+    """Get the lower Cholesky factor of the covariance matrix of the covariates."""
+    try:
+        return np.linalg.cholesky(np.atleast_2d(np.cov(x, rowvar=False)))
+    except np.linalg.LinAlgError:
+        raise AssertionError("unable to whiten covariates, covariance matrix is singular")
+
+
+def get_whitened_covariates(x, cholesky_factor):
+    """Get the covariates whitened by the lower Cholesky factor of their covariance matrix."""
+    return solve_triangular(cholesky_factor, np.asarray(x, dtype=float).T, lower=True).T
+
+
+def get_covariate_neighbors(
+    x, x_pool, num_neighbors=1, radius=None, cholesky_factor=None, batch_size=10000
+):
+    """Get the nearest neighbors by the Mahalanobis distance of the covariates.
+
+    We answer the queries in batches, so the memory requirements remain bounded for large
+    samples.
+
+    Args:
+        x: A numpy array of shape (num_units, num_covariates) with the covariates of the units to
+            be matched.
+        x_pool: A numpy array of shape (num_pool, num_covariates) with the covariates of the
+            potential matches.
+        num_neighbors: An integer with the number of neighbors for each unit. If None, all
+            potential matches within the radius are neighbors.
+        radius: A float with the maximum Mahalanobis distance between a unit and its neighbors,
+            defaults to no restriction.
+        cholesky_factor: A numpy array with the lower Cholesky factor of the covariance matrix,
+            defaults to the one of all covariates.
+        batch_size: An integer with the number of units in each batch of queries.
+
+    Returns:
+        A numpy array of shape (num_units, num_neighbors) with the positions of the neighbors in
+        the pool, ordered by their distance, and -1 where no neighbor is found. For radius
+        queries, the second dimension is the largest number of neighbors of any unit.
+    """
+    x, x_pool = np.atleast_2d(x), np.atleast_2d(x_pool)
+
+    if num_neighbors is None and radius is None:
+        raise AssertionError("unable to match, radius queries require a radius")
+
+    if cholesky_factor is None:
+        cholesky_factor = get_cholesky_factor(np.concatenate((x, x_pool)))
+
+    tree = cKDTree(get_whitened_covariates(x_pool, cholesky_factor))
+
+    batches = list()
+    for start in range(0, len(x), batch_size):
+        z = get_whitened_covariates(x[start : start + batch_size], cholesky_factor)
+
+        if num_neighbors is None:
+            # The tree returns the neighbors within the radius ordered by their position in the
+            # pool at best, so we order them by their distance ourselves.
+            neighbors = tree.query_ball_point(z, radius, return_sorted=True)
+            for i, idx in enumerate(neighbors):
+                distance = np.linalg.norm(tree.data[idx] - z[i], axis=1)
+                neighbors[i] = np.asarray(idx, dtype=int)[np.argsort(distance, kind="stable")]
+            batches.append(neighbors)
+        else:
+            upper = np.inf if radius is None else radius
+            _, neighbors = tree.query(
+                z, k=list(range(1, num_neighbors + 1)), distance_upper_bound=upper
+            )
+            batches.append(np.where(neighbors < len(x_pool), neighbors, -1))
+
+    if num_neighbors is None:
+        neighbors = [idx for batch in batches for idx in batch]
+        rslt = np.full((len(x), max(map(len, neighbors), default=0)), -1)
+        for i, idx in enumerate(neighbors):
+            rslt[i, : len(idx)] = idx
+    else:
+        rslt = np.concatenate(batches) if batches else np.full((0, num_neighbors), -1)
+
+    return rslt
+
+
+def get_matched_outcomes(df, covariates, estimand="ATT", **kwargs):
+    """Get the potential outcomes with the missing ones imputed by matching on the covariates.
+
+    Args:
+        df: A dataframe with the observed outcome ``Y``, the treatment indicator ``D``, the
+            potential outcomes ``Y_1`` and ``Y_0`` where observed, and the covariates, e.g. as
+            returned by ``get_lalonde_data``.
+        covariates: A list with the covariates for matching.
+        estimand: A string with the estimand, which determines the units to be matched. For the
+            ATT, only the treated units are matched to the control units.
+        kwargs: Further arguments passed to ``get_covariate_neighbors``.
+
+    Returns:
+        A dataframe with the potential outcomes, which remain missing for units without
+        neighbors.
+    """
+    if estimand not in ESTIMANDS:
+        raise NotImplementedError
+
+    df = df.copy()
+    is_treated = df["D"].to_numpy() == 1
+
+    if is_treated.all() or not is_treated.any():
+        raise AssertionError("unable to match, both treatment groups need to be observed")
+
+    x = df[covariates].to_numpy(dtype=float)
+    y = df["Y"].to_numpy(dtype=float)
+
+    kwargs.setdefault("cholesky_factor", get_cholesky_factor(x))
+
+    groups = list()
+    if estimand in ["ATT", "ATE"]:
+        groups.append((is_treated, "Y_0"))
+    if estimand in ["ATC", "ATE"]:
+        groups.append((~is_treated, "Y_1"))
+
+    for is_group, label in groups:
+        neighbors = get_covariate_neighbors(x[is_group], x[~is_group], **kwargs)
+
+        values = df[label].to_numpy(dtype=float, copy=True)
+        values[is_group] = get_neighbor_means(y[~is_group], neighbors)
+        df[label] = values
+
+    return df
+
+
+def get_covariate_matching_estimate(df, covariates, estimand="ATT", **kwargs):
+    """Get the matching estimate of an average treatment effect by the Mahalanobis distance.
+
+    Args:
+        df: A dataframe with the layout as in ``get_matched_outcomes``.
+        covariates: A list with the covariates for matching.
+        estimand: A string with the estimand, which is one of "ATT", "ATC", or "ATE".
+        kwargs: Further arguments passed to ``get_covariate_neighbors``.
+
+    Returns:
+        A float with the estimate.
+    """
+    df = get_matched_outcomes(df, covariates, estimand, **kwargs)
+
+    if estimand == "ATT":
+        df = df[df["D"] == 1]
+    elif estimand == "ATC":
+        df = df[df["D"] == 0]
+
+    effects = (df["Y_1"] - df["Y_0"]).dropna()
+
+    if len(effects) == 0:
+        raise AssertionError("unable to match, no unit has a neighbor within the radius")
+
+    return effects.mean()
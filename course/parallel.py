@@ -0,0 +1,32 @@
+"""This module contains the dispatch of independent tasks across worker processes.
+
+The function and the tasks are sent to the workers, so the function needs to be defined at the
+module level (or be a ``functools.partial`` of such a function).
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+
+def map_tasks(func, tasks, num_jobs=1):
+    """Map the tasks to their results, either in the current process or across workers.
+
+    We send the tasks to the workers in chunks, so many small tasks do not pay the overhead of the
+    communication each.
+
+    Args:
+        func: A function that is called for each task.
+        tasks: A list with the tasks.
+        num_jobs: An integer with the number of worker processes, where zero uses all cores.
+            All tasks run in the current process for a single job.
+
+    Returns:
+        A list with the results in the order of the tasks.
+    """
+    num_jobs = num_jobs if num_jobs > 0 else os.cpu_count()
+
+    if num_jobs == 1:
+        return list(map(func, tasks))
+
+    chunksize = max(1, len(tasks) // (4 * num_jobs))
+    with ProcessPoolExecutor(num_jobs) as executor:
+        return list(executor.map(func, tasks, chunksize=chunksize))
@@ -0,0 +1,58 @@
+"""This module contains the engine for Monte Carlo replications.
+
+Each replication draws from its own child of a np.random.SeedSequence, so the results only depend
+on the seed and not on how the replications are distributed across the worker processes by
+``course.parallel.map_tasks``.
+"""
+import functools
+
+import numpy as np
+import pandas as pd
+
+from course.parallel import map_tasks
+from course.rng import get_seed_sequence
+
+
+def run_replication(sampler, estimator, seed):
+    """Run a single replication.
+
+    Args:
+        sampler: A function that returns a sample for a np.random.Generator passed as ``seed``.
+        estimator: A function that returns the estimates for a sample, either as a float, a
+            dictionary, or a series.
+        seed: A np.random.SeedSequence for the replication.
+
+    Returns:
+        A dictionary with the estimates.
+    """
+    rslt = estimator(sampler(seed=np.random.default_rng(seed)))
+
+    if np.isscalar(rslt):
+        rslt = {"Estimate": rslt}
+
+    return dict(rslt)
+
+
+def run_replications(sampler, estimator, num_replications, seed=None, num_jobs=1):
+    """Run the Monte Carlo replications.
+
+    Args:
+        sampler: A function that returns a sample for a np.random.Generator passed as ``seed``,
+            e.g. ``functools.partial(get_quick_sample, 1000)``.
+        estimator: A function that returns the estimates for a sample, either as a float, a
+            dictionary, or a series.
+        num_replications: An integer with the number of replications.
+        seed: An integer or a np.random.SeedSequence, defaults to NumPy's global state.
+        num_jobs: An integer with the number of worker processes, where zero uses all cores.
+            All replications run in the current process for a single job.
+
+    Returns:
+        A dataframe with one row for each replication and one column for each estimate.
+    """
+    seeds = get_seed_sequence(seed).spawn(num_replications)
+    func = functools.partial(run_replication, sampler, estimator)
+    rslts = map_tasks(func, seeds, num_jobs)
+
+    df = pd.DataFrame(rslts, index=pd.RangeIndex(num_replications, name="Replication"))
+
+    return df
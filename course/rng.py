@@ -0,0 +1,35 @@
+"""This module contains the handling of random number generators shared across the samplers."""
+import numpy as np
+
+
+def get_rng(seed=None):
+    """Get a random number generator.
+
+    Args:
+        seed: an integer, a np.random.SeedSequence, or a np.random.Generator, which is returned
+            as is. Without a seed, we draw one from NumPy's global state, so `np.random.seed`
+            continues to make the notebooks reproducible.
+
+    Returns:
+        A np.random.Generator.
+    """
+    if seed is None:
+        seed = np.random.randint(2**31)
+    return np.random.default_rng(seed)
+
+
+def get_seed_sequence(seed=None):
+    """Get a seed sequence to spawn independent streams from.
+
+    Args:
+        seed: an integer or a np.random.SeedSequence, which is returned as is. Without a seed, we
+            draw one from NumPy's global state just as in `get_rng`.
+
+    Returns:
+        A np.random.SeedSequence.
+    """
+    if isinstance(seed, np.random.SeedSequence):
+        return seed
+    if seed is None:
+        seed = np.random.randint(2**31)
+    return np.random.SeedSequence(seed)
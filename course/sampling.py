@@ -0,0 +1,46 @@
+"""This module contains the samplers shared across the simulated demonstrations."""
+import numpy as np
+import pandas as pd
+
+
+def get_sample_strata(shares, means, num_agents, rng):
+    """Get a sample from a population that is partitioned into strata.
+
+    We draw one uniform for each agent and map it to its cell in the population with a binary
+    search over the cumulative shares. The potential outcomes are the mean of the stratum plus
+    standard normal noise. All draws are done for the whole sample at once.
+
+    Args:
+        shares: A dictionary that maps the cells (S, D) to their share in the population.
+        means: A dictionary that maps the strata S to the means of the potential outcomes
+            (Y_1, Y_0). A missing value marks a potential outcome that is not defined in the
+            stratum.
+        num_agents: An integer that specifies the number of individuals to sample.
+        rng: A np.random.Generator.
+
+    Returns:
+        Returns a dataframe with the observables (Y, D, S) as well as the unobservables
+        (Y_1, Y_0).
+    """
+    cells = np.array(list(shares.keys()), dtype=int)
+    cdf = np.cumsum(list(shares.values()))
+
+    if not np.isclose(cdf[-1], 1.0):
+        raise AssertionError("unable to sample, shares do not sum to one")
+
+    # We guard against rounding in the cumulative shares, which otherwise might leave the
+    # uniforms close to one without a cell.
+    idx = np.searchsorted(cdf, rng.uniform(size=num_agents), side="right")
+    s, d = cells[np.minimum(idx, len(cells) - 1)].T
+
+    # We need a lookup table for the means that is indexed by the stratum directly.
+    table = np.tile(np.nan, (cells[:, 0].max() + 1, 2))
+    for stratum, value in means.items():
+        table[stratum] = value
+
+    y_1, y_0 = table[s].T + rng.normal(size=(2, num_agents))
+    y = np.where(d == 1, y_1, y_0)
+
+    df = pd.DataFrame({"Y": y, "D": d, "S": s, "Y_1": y_1, "Y_0": y_0})
+
+    return df
@@ -0,0 +1,105 @@
+"""This module contains the subclassification estimator for the average treatment effects.
+
+We factorize the strata into integer codes once and then aggregate the outcomes of the treated
+and control units within each stratum with ``np.bincount``, which scales to hundreds of thousands
+of strata, e.g. a fine binning of the propensity score.
+"""
+import numpy as np
+import pandas as pd
+
+ESTIMANDS = ["ATT", "ATC", "ATE"]
+
+
+def get_strata_codes(strata):
+    """Get the integer codes of the strata.
+
+    Args:
+        strata: An array-like with the stratum of each unit, or a dataframe where each
+            combination of the values in a row defines a stratum.
+
+    Returns:
+        A numpy array with the integer code of the stratum of each unit and an index with the
+        sorted strata, which the codes refer to.
+    """
+    # The factorization of a dataframe treats missing values as a stratum of their own.
+    if isinstance(strata, pd.DataFrame) and strata.isna().to_numpy().any():
+        raise AssertionError("unable to stratify, strata contain missing values")
+
+    if isinstance(strata, pd.DataFrame):
+        codes, labels = pd.MultiIndex.from_frame(strata).factorize(sort=True)
+        labels = pd.MultiIndex.from_tuples(labels, names=list(strata.columns))
+    else:
+        codes, labels = pd.factorize(np.asarray(strata), sort=True)
+        labels = pd.Index(labels, name=getattr(strata, "name", None))
+
+    if np.any(codes < 0):
+        raise AssertionError("unable to stratify, strata contain missing values")
+
+    return codes, labels
+
+
+def get_strata_statistics(y, d, strata):
+    """Get the number of units and their average outcome by treatment status in each stratum.
+
+    Args:
+        y: A numpy array with the observed outcomes.
+        d: A numpy array with the treatment indicators.
+        strata: An array-like or a dataframe with the strata as in ``get_strata_codes``.
+
+    Returns:
+        A dataframe with the counts and means of the outcome of the treated and control units,
+        indexed by the strata.
+    """
+    y, d = np.asarray(y, dtype=float), np.asarray(d, dtype=float)
+    codes, labels = get_strata_codes(strata)
+    num_strata = len(labels)
+
+    count = np.bincount(codes, minlength=num_strata)
+    count_1 = np.bincount(codes, weights=d, minlength=num_strata)
+    sum_1 = np.bincount(codes, weights=d * y, minlength=num_strata)
+    sum_0 = np.bincount(codes, weights=(1 - d) * y, minlength=num_strata)
+
+    df = pd.DataFrame(index=labels)
+    df["Count_1"] = count_1.astype(int)
+    df["Count_0"] = count - df["Count_1"]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        df["Y_1"] = sum_1 / count_1
+        df["Y_0"] = sum_0 / df["Count_0"].to_numpy()
+
+    return df
+
+
+def get_stratification_estimate(y, d, strata, estimand="ATE"):
+    """Get the subclassification estimate of an average treatment effect.
+
+    We average the differences in the mean outcomes of the treated and control units within each
+    stratum. The weights are the number of all, treated, or control units in the strata for the
+    ATE, ATT, and ATC, respectively. Strata without treated or control units are outside the
+    common support and dropped.
+
+    Args:
+        y: A numpy array with the observed outcomes.
+        d: A numpy array with the treatment indicators.
+        strata: An array-like or a dataframe with the strata as in ``get_strata_codes``.
+        estimand: A string with the estimand, which is one of "ATT", "ATC", or "ATE".
+
+    Returns:
+        A float with the estimate.
+    """
+    if estimand not in ESTIMANDS:
+        raise NotImplementedError
+
+    df = get_strata_statistics(y, d, strata)
+    df = df[(df["Count_1"] > 0) & (df["Count_0"] > 0)]
+
+    if len(df) == 0:
+        raise AssertionError("unable to stratify, no stratum contains treated and control units")
+
+    if estimand == "ATE":
+        weights = df["Count_1"] + df["Count_0"]
+    elif estimand == "ATT":
+        weights = df["Count_1"]
+    else:
+        weights = df["Count_0"]
+
+    return np.average(df["Y_1"] - df["Y_0"], weights=weights)
@@ -0,0 +1,142 @@
+"""This module contains the streaming interface for simulations that do not fit into memory.
+
+A sampler is any function that takes the number of agents as its first argument and a random
+number generator as its ``seed``, e.g. ``get_quick_sample`` or
+``functools.partial(get_sample_bias_illustration, 0)``. We draw the sample in chunks of fixed size
+and consume them with reducers that only keep running sums in memory.
+"""
+import numpy as np
+import pandas as pd
+
+from course.rng import get_rng
+
+
+def get_chunks(sampler, num_agents, chunk_size=100000, seed=None):
+    """Get the sample in chunks of fixed size.
+
+    All chunks are drawn from the same random number generator, so the sequence of chunks is
+    reproducible for a given seed and chunk size.
+
+    Args:
+        sampler: A function that returns a dataframe for the number of agents and a
+            np.random.Generator passed as ``seed``.
+        num_agents: An integer with the total number of agents.
+        chunk_size: An integer with the number of agents in each chunk, only the last chunk
+            might be smaller.
+        seed: An integer or a np.random.Generator, defaults to NumPy's global state.
+
+    Yields:
+        A dataframe with the sample of the chunk.
+    """
+    if chunk_size < 1:
+        raise AssertionError("unable to stream, chunk size needs to be positive")
+
+    rng = get_rng(seed)
+    for start in range(0, num_agents, chunk_size):
+        yield sampler(min(chunk_size, num_agents - start), seed=rng)
+
+
+def get_means(chunks, columns=None):
+    """Get the means of the columns in a stream of chunks.
+
+    Missing values are ignored, just as in ``pd.DataFrame.mean``.
+
+    Args:
+        chunks: An iterable of dataframes.
+        columns: A list with the columns of interest, defaults to all columns.
+
+    Returns:
+        A series with the mean of each column.
+    """
+    sums, counts = None, None
+    for df in chunks:
+        df = df if columns is None else df[columns]
+        if sums is None:
+            sums, counts = df.sum(), df.count()
+        else:
+            sums, counts = sums + df.sum(), counts + df.count()
+
+    if sums is None:
+        raise AssertionError("unable to compute means, stream is empty")
+
+    return sums / counts
+
+
+def get_group_means(chunks, by, columns):
+    """Get the means of the columns by group in a stream of chunks.
+
+    Args:
+        chunks: An iterable of dataframes.
+        by: A column or a list of columns that define the groups.
+        columns: A list with the columns of interest.
+
+    Returns:
+        A dataframe with the means of each group.
+    """
+    sums, counts = None, None
+    for df in chunks:
+        grouped = df.groupby(by)[columns]
+        if sums is None:
+            sums, counts = grouped.sum(), grouped.count()
+        else:
+            sums = sums.add(grouped.sum(), fill_value=0)
+            counts = counts.add(grouped.count(), fill_value=0)
+
+    if sums is None:
+        raise AssertionError("unable to compute group means, stream is empty")
+
+    return (sums / counts).sort_index()
+
+
+def get_ols_statistics(chunks, endog, exog, constant=True):
+    """Get the sufficient statistics of an OLS regression in a stream of chunks.
+
+    Args:
+        chunks: An iterable of dataframes.
+        endog: A string with the dependent variable.
+        exog: A list with the regressors.
+        constant: A boolean that indicates whether an intercept is included.
+
+    Returns:
+        A dictionary with the cross products ``xtx``, ``xty``, and ``yty``, the number of
+        observations ``nobs``, and the ``labels`` of the regressors.
+    """
+    labels = (["Intercept"] if constant else []) + list(exog)
+
+    stats = dict()
+    stats["xtx"] = np.zeros((len(labels), len(labels)))
+    stats["xty"] = np.zeros(len(labels))
+    stats["yty"], stats["nobs"], stats["labels"] = 0.0, 0, labels
+
+    for df in chunks:
+        x = df[exog].to_numpy(dtype=float)
+        if constant:
+            x = np.column_stack((np.ones(len(x)), x))
+        y = df[endog].to_numpy(dtype=float)
+
+        stats["xtx"] += x.T @ x
+        stats["xty"] += x.T @ y
+        stats["yty"] += y @ y
+        stats["nobs"] += len(y)
+
+    return stats
+
+
+def get_ols_estimates(stats):
+    """Get the OLS estimates from the sufficient statistics.
+
+    Args:
+        stats: A dictionary as returned by ``get_ols_statistics``.
+
+    Returns:
+        A dataframe with the coefficients ``params`` and their standard errors ``bse`` under
+        homoskedasticity.
+    """
+    xtx_inv = np.linalg.inv(stats["xtx"])
+    params = xtx_inv @ stats["xty"]
+
+    ssr = stats["yty"] - params @ stats["xty"]
+    sigma2 = ssr / (stats["nobs"] - len(params))
+    bse = np.sqrt(np.diag(xtx_inv) * sigma2)
+
+    return pd.DataFrame({"params": params, "bse": bse}, index=stats["labels"])
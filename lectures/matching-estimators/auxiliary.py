@@ -1,26 +1,30 @@
-import collections
-
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
-import statsmodels.formula.api as smf
 from mpl_toolkits.mplot3d import Axes3D  # noqa: F401
 
+from course.datasets import load_dataset
+from course.fitting import get_design
+from course.logit import fit_logit
+from course.rng import get_rng
+from course.sampling import get_sample_strata
+
 
-def get_potential_outcomes(a, b):
+def get_potential_outcomes(a, b, rng=np.random):
     """Get potential outcomes.
 
     This function calculates the potential outcomes based on the functional from as described in
     our textbook on p. 153.
 
     Args:
-        a: a float
-        b: a float
+        a: a float or an array
+        b: a float or an array
+        rng: a np.random.Generator, defaults to NumPy's global state
 
     Returns:
         A list with the individuals potential outcomes.
     """
-    v_0, v_1 = np.random.normal(0, 5, size=2)
+    v_0, v_1 = rng.normal(0, 5, size=(2,) + np.shape(a))
     y_0 = 100.0 + 3.0 * a + 2.0 * b + v_0
     y_1 = 102.0 + 6.0 * a + 4.0 * b + v_1
     return [y_1, y_0]
@@ -32,50 +36,73 @@ def get_propensity_score_3(df, specification="true"):
 
         p = df["p"]
     elif specification == "correct":
-        p = smf.logit(formula="d ~ a + b + a * b", data=df).fit().predict()
+        p = get_estimated_propensity_score("d ~ a + b + a * b", df)
     elif specification == "misspecified":
-        p = smf.logit(formula="d ~ a + b", data=df).fit().predict()
+        p = get_estimated_propensity_score("d ~ a + b", df)
 
     return p
 
 
-def get_sample_matching_demonstration_3(a_grid, b_grid):
+def get_estimated_propensity_score(formula, df):
+    """Get the estimated propensity score.
+
+    We only need the fitted probabilities of the logit model, so we neither build the full
+    statsmodels results nor parse the formula again for the same data.
+
+    Args:
+        formula: A string with the formula in the patsy syntax.
+        df: A dataframe with the variables in the formula.
+
+    Returns:
+        A series with the propensity score.
+    """
+    design = get_design(formula, df)
+    p = fit_logit(design["endog"], design["exog"], predictions_only=True)
+
+    return pd.Series(p, index=design["index"])
+
+
+def get_sample_matching_demonstration_3(a_grid, b_grid, seed=None):
     """Match demonstration 3.
 
     This function implements the third matching demonstration. It's key feature lies in the
     sparsity patterns.
 
-    """
-    sample, counts = list(), np.tile(np.nan, (3, 100, 100))
-
-    for i, a in enumerate(a_grid):
-        for j, b in enumerate(b_grid):
+    We evaluate the propensity score on the whole grid and draw the number of treated and
+    untreated individuals in each cell at once. The cells are then expanded to one row per
+    individual, so grids of any size are supported.
 
-            prob = get_propensity_score(a, b)
+    Args:
+        a_grid: an array with the values of a
+        b_grid: an array with the values of b
+        seed: an integer or a np.random.Generator, defaults to NumPy's global state
 
-            lambda_ = dict()
-            lambda_["treat"] = prob
-            lambda_["contr"] = 1 - prob
+    Returns:
+        A DataFrame with the sample and an array with the counts of treated, untreated, and all
+        individuals in each cell.
+    """
+    rng = get_rng(seed)
 
-            # Now we determine the number of observed individuals
-            for k, group in enumerate(["treat", "contr"]):
+    a, b = np.meshgrid(a_grid, b_grid, indexing="ij")
+    prob = get_propensity_score(a, b)
 
-                num_sample = np.random.poisson(lambda_[group])
-                counts[k, i, j] = num_sample
+    # Now we determine the number of observed individuals
+    counts = np.tile(np.nan, (3,) + prob.shape)
+    counts[0] = rng.poisson(prob)
+    counts[1] = rng.poisson(1 - prob)
 
-                for _ in range(num_sample):
-                    d = np.random.choice([1, 0], p=[prob, 1 - prob])
-                    y_1, y_0 = get_potential_outcomes(a, b)
-                    y = d * y_1 + (1 - d) * y_0
+    # Here we construct the overall count for each cell consisting of treated and
+    # untreated individuals.
+    counts[2] = counts[:2].sum(axis=0)
 
-                    sample += [[a, b, d, y, y_1, y_0, prob]]
+    num_sample = counts[2].astype(int).ravel()
+    a, b, prob = [np.repeat(info.ravel(), num_sample) for info in [a, b, prob]]
 
-            # Here we construct the overall count for each cell consisting of treated and
-            # untreated individuals.
-            counts[2, i, j] = np.sum(counts[:2, i, j])
+    d = (rng.uniform(size=prob.size) < prob).astype(int)
+    y_1, y_0 = get_potential_outcomes(a, b, rng)
+    y = d * y_1 + (1 - d) * y_0
 
-    columns = ["a", "b", "d", "y", "y_1", "y_0", "p"]
-    df = pd.DataFrame(sample, columns=columns)
+    df = pd.DataFrame({"a": a, "b": b, "d": d, "y": y, "y_1": y_1, "y_0": y_0, "p": prob})
 
     return df, counts
 
@@ -118,61 +145,26 @@ def plot_propensity_score(a_grid, b_grid):
     ax.set_zlabel("Propensity Score")
 
 
-def get_sample_matching_demonstration_2(num_agents):
-    def get_potential_outcomes(s):
-        if s == 1:
-            y_1, y_0 = -99, 2
-        elif s == 2:
-            y_1, y_0 = 8, 6
-        elif s == 3:
-            y_1, y_0 = 14, 10
-        else:
-            raise AssertionError
-
-        # We want some randomness
-        y_1 += np.random.normal()
-        y_0 += np.random.normal()
-
-        return y_1, y_0
-
-    data = np.tile(np.nan, (num_agents, 5))
-    for i in range(num_agents):
-        u = np.random.uniform()
-
-        if 0.00 <= u < 0.40:
-            s, d = 1, 0
-        elif 0.40 <= u < 0.50:
-            s, d = 2, 0
-        elif 0.50 <= u < 0.60:
-            s, d = 3, 0
-        elif 0.60 <= u < 0.73:
-            s, d = 2, 1
-        else:
-            s, d = 3, 1
-
-        y_1, y_0 = get_potential_outcomes(s)
-        y = d * y_1 + (1 - d) * y_0
-
-        data[i, :] = y, d, s, y_1, y_0
+# The population shares of the cells (S, D) and the means of the potential outcomes (Y_1, Y_0)
+# in each stratum S. There are no treated individuals in the first stratum, so their outcome
+# under treatment is missing.
+SHARES_MATCHING_DEMONSTRATION_2 = {
+    (1, 0): 0.40,
+    (2, 0): 0.10,
+    (3, 0): 0.10,
+    (2, 1): 0.13,
+    (3, 1): 0.27,
+}
+MEANS_MATCHING_DEMONSTRATION_2 = {1: (np.nan, 2), 2: (8, 6), 3: (14, 10)}
 
-    info = collections.OrderedDict()
-    info["Y"] = float
-    info["D"] = int
-    info["S"] = int
-    info["Y_1"] = float
-    info["Y_0"] = float
 
-    df = pd.DataFrame(data, columns=info.keys())
-    df = df.astype(info)
-    df.replace(-99, np.nan, inplace=True)
-
-    return df
+def get_sample_matching_demonstration_2(num_agents, seed=None):
+    shares, means = SHARES_MATCHING_DEMONSTRATION_2, MEANS_MATCHING_DEMONSTRATION_2
+    return get_sample_strata(shares, means, num_agents, get_rng(seed))
 
 
 def get_sample_matching_demonstration_4():
-    # This allows to run it locally but also check out the files from an online
-    # repository.
-    df = pd.read_csv("../../datasets/processed/morgan_winship/mw_cath1.csv")
+    df = load_dataset("morgan_winship", "mw_cath1")
     return df
 
 
@@ -194,7 +186,7 @@ def get_propensity_scores_matching_demonstration_4(df, specification="complete")
     # complete specification
     columns = get_columns_for_estimation(specification)
     formula = "treat ~ {:}".format(" + ".join(columns))
-    prob = smf.logit(formula=formula, data=df).fit().predict()
+    prob = get_estimated_propensity_score(formula, df)
 
     return prob
 
@@ -229,7 +221,7 @@ def get_common_support(df, label="d"):
 
 
 def get_lalonde_data():
-    df = pd.read_csv("../../datasets/processed/dehejia_waba/nsw_lalonde.csv")
+    df = load_dataset("dehejia_waba", "nsw_lalonde")
 
     df["Y"] = df["re78"]
     df["Y_0"] = df.loc[df["treat"] == 0, "re78"]
@@ -244,11 +236,7 @@ def get_lalonde_data():
 def plot_weights():
 
     x_grid = np.linspace(0.01, 0.99, 100)
-    inv_odds_grid = list()
-    odds_grid = list()
-    for x in x_grid:
-        odds_grid.append(get_odds(x))
-        inv_odds_grid.append(get_inv_odds(x))
+    odds_grid, inv_odds_grid = get_odds(x_grid), get_inv_odds(x_grid)
 
     fig, ax = plt.subplots(1, 1)
     ax.plot(x_grid, odds_grid, label="ATT")
@@ -265,3 +253,55 @@ def get_odds(p):
 
 def get_inv_odds(p):
     return (1 - p) / p
+
+
+def get_weighting_estimate(y, d, p, estimand="ATE", trim=0.0, normalize=True):
+    """Get the inverse probability weighting estimate of an average treatment effect.
+
+    The weights for the ATT and ATC are the odds and the inverse odds of the propensity score
+    for the control and treated units, respectively. For the ATE, the weights are the inverse of
+    the probability of the observed treatment status. All arguments can be arrays for a whole
+    batch of samples, where the last axis collects the individuals.
+
+    Args:
+        y: A numpy array with the observed outcomes.
+        d: A numpy array with the treatment indicators.
+        p: A numpy array with the propensity scores.
+        estimand: A string with the estimand, which is one of "ATT", "ATC", or "ATE".
+        trim: A float with the trimming threshold, i.e. we drop all individuals with a
+            propensity score below the threshold or above one minus the threshold.
+        normalize: A boolean that indicates whether the weights are normalized to sum to one
+            in each treatment group (Hajek) or not (Horvitz-Thompson).
+
+    Returns:
+        A float or a numpy array with the estimate.
+    """
+    y, d, p = np.asarray(y, dtype=float), np.asarray(d), np.asarray(p, dtype=float)
+
+    is_kept = (p >= trim) & (p <= 1 - trim)
+    is_treated, is_control = is_kept & (d == 1), is_kept & (d == 0)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if estimand == "ATE":
+            weights_1, weights_0 = 1 / p, 1 / (1 - p)
+            num_obs = is_kept.sum(axis=-1)
+        elif estimand == "ATT":
+            weights_1, weights_0 = np.ones_like(p), get_odds(p)
+            num_obs = is_treated.sum(axis=-1)
+        elif estimand == "ATC":
+            weights_1, weights_0 = get_inv_odds(p), np.ones_like(p)
+            num_obs = is_control.sum(axis=-1)
+        else:
+            raise NotImplementedError
+
+        weights_1 = np.where(is_treated, weights_1, 0.0)
+        weights_0 = np.where(is_control, weights_0, 0.0)
+
+        if normalize:
+            mean_1 = (weights_1 * y).sum(axis=-1) / weights_1.sum(axis=-1)
+            mean_0 = (weights_0 * y).sum(axis=-1) / weights_0.sum(axis=-1)
+        else:
+            mean_1 = (weights_1 * y).sum(axis=-1) / num_obs
+            mean_0 = (weights_0 * y).sum(axis=-1) / num_obs
+
+    return mean_1 - mean_0
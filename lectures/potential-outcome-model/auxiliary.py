@@ -1,10 +1,11 @@
 import matplotlib.pyplot as plt
 import numpy as np
-import pandas as pd
 import scipy.stats as ss
 from matplotlib.ticker import FixedFormatter
 from matplotlib.ticker import FixedLocator
 
+from course.datasets import load_dataset
+
 
 def plot_individual_specific_effects(with_parameters=None):
 
@@ -36,8 +37,8 @@ def plot_individual_specific_effects(with_parameters=None):
 
 def get_lalonde_data():
 
-    df = pd.read_csv("../../datasets/processed/dehejia_waba/nsw_lalonde.csv")
-    df = df[["treat", "re78"]].sample(frac=1)
+    df = load_dataset("dehejia_waba", "nsw_lalonde", columns=["treat", "re78"])
+    df = df.sample(frac=1)
 
     df["Y"] = df["re78"]
     df["Y_0"] = df.query("treat == 0")["re78"]
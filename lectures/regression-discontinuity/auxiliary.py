@@ -1,15 +1,13 @@
 import matplotlib.pyplot as plt
-from scipy.stats import logistic
+import numpy as np
+from scipy.special import expit
 
 
-def observed_outcome(grid, version):
+def observed_outcome(grid, version, cutoff=0.25, jump=0.2):
     y1, y0 = get_potential_outcomes(grid)
+    probs = get_treatment_probability(version, grid, cutoff, jump)
 
-    rslt = []
-    for i, prob in enumerate(get_treatment_probability(version, grid)):
-        rslt += [prob * y1[i] + (1 - prob) * y0[i]]
-
-    return rslt
+    return probs * y1 + (1 - probs) * y0
 
 
 def get_potential_outcomes(grid):
@@ -19,7 +17,7 @@ def get_potential_outcomes(grid):
     return y1, y0
 
 
-def plot_outcomes(version, grid):
+def plot_outcomes(version, grid, cutoff=0.25, jump=0.2):
     ax = plt.figure().add_subplot(111)
     ax.yaxis.get_major_ticks()[0].set_visible(False)
 
@@ -28,7 +26,7 @@ def plot_outcomes(version, grid):
     ax.plot(grid, y1, label="Treated")
     ax.plot(grid, y0, label="Control")
 
-    y_values = observed_outcome(grid, version)
+    y_values = observed_outcome(grid, version, cutoff, jump)
     ax.plot(grid, y_values, label="Observed", linestyle="--", color="black")
     ax.legend()
     ax.set_title(f"{version.capitalize()} design", fontsize=25)
@@ -37,12 +35,12 @@ def plot_outcomes(version, grid):
     ax.set_ylabel("Outcomes")
 
 
-def get_plot_probability(version, grid, probs):
+def get_plot_probability(version, grid, probs, cutoff=0.25):
     fig, ax = plt.subplots(1, 1)
     ax.yaxis.get_major_ticks()[0].set_visible(False)
 
     ax.plot(grid, probs)
-    plt.plot((0.25, 0.25), (0, 1), "--", color="grey")
+    plt.plot((cutoff, cutoff), (0, 1), "--", color="grey")
 
     ax.set_title(f"{version.capitalize()} design", fontsize=25)
     ax.set_xlabel("X")
@@ -51,22 +49,32 @@ def get_plot_probability(version, grid, probs):
     ax.set_xlim([0, 1])
 
 
-def get_treatment_probability(version, grid):
-    """Assign a probability of treatment assignment around the example's cutoff."""
-    probs = list()
-    for z in grid:
-        if version == "sharp":
-            if z > 0.25:
-                rslt = 1
-            else:
-                rslt = 0
-
-        elif version == "fuzzy":
-            rslt = logistic.cdf((z - 0.25) * 20)
-            if z > 0.25:
-                rslt = min(rslt + 0.1, 1.0)
-            elif z <= 0.25:
-                rslt = max(rslt - 0.1, 0.0)
-        probs.append(rslt)
+def get_treatment_probability(version, grid, cutoff=0.25, jump=0.2):
+    """Assign a probability of treatment assignment around the example's cutoff.
+
+    The probabilities are computed for the whole grid at once. In the sharp design, everybody
+    above the cutoff is treated. In the fuzzy design, the probability increases smoothly with
+    the running variable and jumps by the specified amount at the cutoff.
+
+    Args:
+        version: A string with the design, either "sharp" or "fuzzy".
+        grid: A numpy array with the values of the running variable.
+        cutoff: A float with the cutoff of the running variable.
+        jump: A float with the size of the discontinuity in the probability at the cutoff
+            for the fuzzy design.
+
+    Returns:
+        A numpy array with the probability of treatment at each point of the grid.
+    """
+    grid = np.asarray(grid, dtype=float)
+    is_above = grid > cutoff
+
+    if version == "sharp":
+        probs = is_above.astype(float)
+    elif version == "fuzzy":
+        probs = expit((grid - cutoff) * 20) + np.where(is_above, jump, -jump) / 2
+        probs = np.clip(probs, 0.0, 1.0)
+    else:
+        raise NotImplementedError
 
     return probs
@@ -3,19 +3,37 @@ import numpy as np
 import pandas as pd
 import seaborn as sns
 import statsmodels.formula.api as smf
+from scipy import stats
 
+from course.fitting import fit_ols
+from course.rng import get_rng
+from course.sampling import get_sample_strata
 
-def get_quick_sample(num_samples):
+# We stack this many replications of the Freedman exercise, which needs about 40MB of memory for
+# the default sample.
+FREEDMAN_BATCH_SIZE = 1000
 
-    df = pd.DataFrame(columns=["Y", "D", "X"])
 
-    for i in range(num_samples):
-        x = np.random.normal()
-        d = (x + np.random.normal()) > 0
-        y = d + x + np.random.normal()
-        df.loc[i] = [y, d, x]
+def get_quick_sample(num_samples, seed=None):
+    """Get a quick sample.
 
-    df = df.astype({"D": int})
+    All draws are done for the whole sample at once, so the function scales to millions of
+    samples.
+
+    Args:
+        num_samples: an integer with the number of samples
+        seed: an integer or a np.random.Generator, defaults to NumPy's global state
+
+    Returns:
+        A DataFrame with the outcome, the treatment indicator, and the covariate.
+    """
+    rng = get_rng(seed)
+
+    x = rng.normal(size=num_samples)
+    d = (x + rng.normal(size=num_samples)) > 0
+    y = d + x + rng.normal(size=num_samples)
+
+    df = pd.DataFrame({"Y": y, "D": d.astype(int), "X": x})
     return df
 
 
@@ -49,6 +67,116 @@ def run_freedman_exercise():
     return rslt
 
 
+def fit_ols_batched(y, x, mask=None):
+    """Fit a batch of OLS regressions at once.
+
+    The regressors of each regression can be restricted with a mask. We replace the rows and
+    columns of the excluded regressors in the cross product with the identity, so their
+    coefficients are zero and the system remains regular.
+
+    Args:
+        y: A numpy array with the outcomes of shape (num_batch, num_obs).
+        x: A numpy array with the regressors of shape (num_batch, num_obs, num_regressors).
+        mask: A boolean numpy array of shape (num_batch, num_regressors) that indicates the
+            included regressors, defaults to all regressors.
+
+    Returns:
+        A dictionary with the coefficients, standard errors, and p-values of shape (num_batch,
+        num_regressors), which are zero or missing for the excluded regressors, as well as the
+        sum of squared residuals and the degrees of freedom of shape (num_batch,).
+    """
+    if mask is None:
+        mask = np.ones(x.shape[::2], dtype=bool)
+
+    outer = mask[:, :, None] & mask[:, None, :]
+    xtx = np.where(outer, np.swapaxes(x, 1, 2) @ x, 0.0) + np.eye(x.shape[2]) * ~outer
+    xty = np.where(mask, (np.swapaxes(x, 1, 2) @ y[:, :, None])[:, :, 0], 0.0)
+
+    xtx_inv = np.linalg.inv(xtx)
+    params = (xtx_inv @ xty[:, :, None])[:, :, 0]
+
+    resid = y - (x @ params[:, :, None])[:, :, 0]
+
+    rslt = dict()
+    rslt["params"] = params
+    rslt["ssr"] = (resid**2).sum(axis=1)
+    rslt["df_resid"] = x.shape[1] - mask.sum(axis=1)
+
+    sigma2 = rslt["ssr"] / rslt["df_resid"]
+    bse = np.sqrt(np.diagonal(xtx_inv, axis1=1, axis2=2) * sigma2[:, None])
+    rslt["bse"] = np.where(mask, bse, np.nan)
+
+    tvalues = params / rslt["bse"]
+    rslt["pvalues"] = 2 * stats.t.sf(np.abs(tvalues), rslt["df_resid"][:, None])
+
+    return rslt
+
+
+def get_freedman_statistics(y, x, threshold=0.25):
+    """Get the results of the Freedman exercise for a batch of samples.
+
+    We first regress the outcome on all regressors without an intercept. We then keep the
+    regressors with a p-value of at most the threshold and refit with an intercept.
+
+    Args:
+        y: A numpy array with the outcomes of shape (num_batch, num_obs).
+        x: A numpy array with the regressors of shape (num_batch, num_obs, num_regressors).
+        threshold: A float with the threshold for the p-values in the screening step.
+
+    Returns:
+        A dataframe with the p-value of the F-statistic and the number of regressors, including
+        the intercept, of the final regression.
+    """
+    rslt = fit_ols_batched(y, x)
+    mask = ~(rslt["pvalues"] > threshold)
+
+    num_batch, num_obs, _ = x.shape
+    x = np.concatenate((np.ones((num_batch, num_obs, 1)), x), axis=2)
+    mask = np.column_stack((np.ones(num_batch, dtype=bool), mask))
+
+    rslt = fit_ols_batched(y, x, mask)
+
+    # The F-statistic tests whether all coefficients besides the intercept are zero.
+    df_model = mask.sum(axis=1) - 1
+    tss = ((y - y.mean(axis=1, keepdims=True)) ** 2).sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        fvalue = (tss - rslt["ssr"]) / df_model / (rslt["ssr"] / rslt["df_resid"])
+        f_pvalue = np.where(df_model > 0, stats.f.sf(fvalue, df_model, rslt["df_resid"]), np.nan)
+
+    df = pd.DataFrame({"F-statistic": f_pvalue, "Regressors": mask.sum(axis=1)})
+
+    return df
+
+
+def run_freedman_exercises(num_replications, num_obs=100, num_regressors=50, seed=None):
+    """Run the Freedman exercise for many replications at once.
+
+    The replications are stacked in batches of fixed size, so the memory requirements remain
+    bounded and the results only depend on the seed.
+
+    Args:
+        num_replications: An integer with the number of replications.
+        num_obs: An integer with the number of observations in each replication.
+        num_regressors: An integer with the number of regressors in each replication.
+        seed: An integer or a np.random.Generator, defaults to NumPy's global state.
+
+    Returns:
+        A dataframe with the p-value of the F-statistic and the number of regressors for each
+        replication.
+    """
+    rng = get_rng(seed)
+
+    dfs = list()
+    for start in range(0, num_replications, FREEDMAN_BATCH_SIZE):
+        num_batch = min(FREEDMAN_BATCH_SIZE, num_replications - start)
+        data = rng.normal(size=(num_batch, num_obs, num_regressors + 1))
+        dfs.append(get_freedman_statistics(data[:, :, 0], data[:, :, 1:]))
+
+    df = pd.concat(dfs, ignore_index=True)
+
+    return df
+
+
 def get_correlation(x, y, df):
 
     stat = df[x].corr(df[y])
@@ -59,141 +187,88 @@ def get_correlation(x, y, df):
         return stat
 
 
-def get_sample_bias_illustration(sample, num_agents=1000):
-    columns = ["Y", "D", "Y_1", "Y_0", "V_1", "V_0", "C"]
-    df = pd.DataFrame(columns=columns, dtype=np.float)
-
-    for i in range(num_agents):
-        group = np.random.choice(range(2))
-
-        if sample == 0:
-            if group == 0:
-                attr_ = 20, 10, 0, 5, 20, 1, 0
-            elif group == 1:
-                attr_ = 20, 0, 0, -5, 0, 0, -5
-            else:
-                raise NotImplementedError
-
-        elif sample == 1:
-            if group == 0:
-                attr_ = 20, 10, 2.5, 0, 20, 1, 2.5
-            elif group == 1:
-                attr_ = 15, 10, -2.5, 0, 10, 0, 0
-            else:
-                raise NotImplementedError
-
-        elif sample == 2:
-            if group == 0:
-                attr_ = 25, 5, 5, -2.5, 25, 1, 5
-            elif group == 1:
-                attr_ = 15, 10, -5, 2.5, 10, 0, 2.5
-            else:
-                raise NotImplementedError
-
-        y_1, y_0, v_1, v_0, y, d, c = attr_
-
-        df.loc[i] = [y, d, y_1, y_0, v_1, v_0, c]
-
-    # We set all but the treatment dummy to float values.
-    df = df.astype(np.float)
-    df = df.astype({"D": np.int})
+# The attributes of the groups in each sample are listed in the order Y_1, Y_0, V_1, V_0, Y, D, and
+# C for the bias illustration or X for the regression adjustment.
+ATTRIBUTES_BIAS_ILLUSTRATION = dict()
+ATTRIBUTES_BIAS_ILLUSTRATION[0] = [(20, 10, 0, 5, 20, 1, 0), (20, 0, 0, -5, 0, 0, -5)]
+ATTRIBUTES_BIAS_ILLUSTRATION[1] = [(20, 10, 2.5, 0, 20, 1, 2.5), (15, 10, -2.5, 0, 10, 0, 0)]
+ATTRIBUTES_BIAS_ILLUSTRATION[2] = [(25, 5, 5, -2.5, 25, 1, 5), (15, 10, -5, 2.5, 10, 0, 2.5)]
+
+# This is a direct copy from the top panel in Table 6.4, where the first two groups are identical.
+ATTRIBUTES_REGRESSION_ADJUSTMENT = dict()
+ATTRIBUTES_REGRESSION_ADJUSTMENT[0] = [
+    (20, 10, 2.5, 2.5, 20, 1, 1),
+    (20, 10, 2.5, 2.5, 20, 1, 1),
+    (15, 5, -2.5, -2.5, 15, 1, 0),
+    (20, 10, 2.5, 2.5, 10, 0, 1),
+    (15, 5, -2.5, -2.5, 5, 0, 0),
+    (15, 5, -2.5, -2.5, 5, 0, 0),
+]
+ATTRIBUTES_REGRESSION_ADJUSTMENT[1] = [
+    (20, 10, 2.83, 2.5, 20, 1, 1),
+    (20, 10, 2.83, 2.5, 20, 1, 1),
+    (15, 5, -2.17, -2.5, 15, 1, 0),
+    (18, 10, 0.83, 2.5, 10, 0, 1),
+    (15, 5, -2.17, -2.5, 5, 0, 0),
+    (15, 5, -2.17, -2.5, 5, 0, 0),
+]
+
+
+def get_sample_from_groups(attributes, labels, columns, num_agents, rng):
+    """Get a sample from groups with equal shares in the population.
+
+    We draw the group of all agents at once and look up their attributes, which are ordered as the
+    labels, in a single step.
+    """
+    groups = rng.integers(len(attributes), size=num_agents)
+    data = np.array(attributes, dtype=float)[groups]
+
+    df = pd.DataFrame(data, columns=labels)[columns]
+    df = df.astype({"D": int})
 
     return df
 
 
+def get_sample_bias_illustration(sample, num_agents=1000, seed=None):
+    """There exist two different groups in the population with equal shares."""
+    if sample not in ATTRIBUTES_BIAS_ILLUSTRATION:
+        raise NotImplementedError
+
+    labels = ["Y_1", "Y_0", "V_1", "V_0", "Y", "D", "C"]
+    columns = ["Y", "D", "Y_1", "Y_0", "V_1", "V_0", "C"]
+    attributes = ATTRIBUTES_BIAS_ILLUSTRATION[sample]
+
+    return get_sample_from_groups(attributes, labels, columns, num_agents, get_rng(seed))
+
+
 def get_sample_regression_adjustment(sample, num_agents=1000, seed=123):
     """There exist six different groups in the population with equal shares."""
-    np.random.seed(seed)
+    if sample not in ATTRIBUTES_REGRESSION_ADJUSTMENT:
+        raise NotImplementedError
+
+    labels = ["Y_1", "Y_0", "V_1", "V_0", "Y", "D", "X"]
     columns = ["Y", "D", "X", "Y_1", "Y_0", "V_1", "V_0"]
-    df = pd.DataFrame(columns=columns)
-
-    for i in range(num_agents):
-
-        group = np.random.choice(range(6))
-
-        if sample == 0:
-
-            # This is a direct copy from the top panel in Table 6.4
-            if group in [0, 1]:
-                attr_ = (20, 10, 2.5, 2.5, 20, 1, 1)
-            elif group == 2:
-                attr_ = 15, 5, -2.5, -2.5, 15, 1, 0
-            elif group == 3:
-                attr_ = 20, 10, 2.5, 2.5, 10, 0, 1
-            elif group == 4:
-                attr_ = 15, 5, -2.5, -2.5, 5, 0, 0
-            elif group == 5:
-                attr_ = 15, 5, -2.5, -2.5, 5, 0, 0
-            else:
-                raise NotImplementedError
-        elif sample == 1:
-
-            if group in [0, 1]:
-                attr_ = 20, 10, 2.83, 2.5, 20, 1, 1
-            elif group == 2:
-                attr_ = 15, 5, -2.17, -2.5, 15, 1, 0
-            elif group == 3:
-                attr_ = 18, 10, 0.83, 2.5, 10, 0, 1
-            elif group == 4:
-                attr_ = 15, 5, -2.17, -2.5, 5, 0, 0
-            elif group == 5:
-                attr_ = 15, 5, -2.17, -2.5, 5, 0, 0
-        else:
-            raise NotImplementedError
-
-        y_1, y_0, v_1, v_0, y, d, x = attr_
-
-        df.loc[i] = [y, d, x, y_1, y_0, v_1, v_0]
-
-    df = df.astype({"D": np.int})
+    attributes = ATTRIBUTES_REGRESSION_ADJUSTMENT[sample]
 
-    return df
+    return get_sample_from_groups(attributes, labels, columns, num_agents, get_rng(seed))
 
 
-def get_sample_demonstration_1(num_agents):
-    data = np.tile(np.nan, (num_agents, 5))
-    for i in range(num_agents):
-        u = np.random.uniform()
-
-        if 0.00 <= u < 0.36:
-            s, d = 1, 0
-        elif 0.36 <= u < 0.48:
-            s, d = 2, 0
-        elif 0.48 <= u < 0.60:
-            s, d = 3, 0
-        elif 0.60 <= u < 0.68:
-            s, d = 1, 1
-        elif 0.68 <= u < 0.80:
-            s, d = 2, 1
-        else:
-            s, d = 3, 1
-
-        # get potential outcomes
-        def get_potential_outcomes(s):
-            if s == 1:
-                y_1, y_0 = 4, 2
-            elif s == 2:
-                y_1, y_0 = 8, 6
-            elif s == 3:
-                y_1, y_0 = 14, 10
-            else:
-                raise AssertionError
-
-            # We want some randomness
-            y_1 += np.random.normal()
-            y_0 += np.random.normal()
-
-            return y_1, y_0
-
-        y_1, y_0 = get_potential_outcomes(s)
-        y = d * y_1 + (1 - d) * y_0
-
-        data[i, :] = y, d, s, y_1, y_0
-
-    df = pd.DataFrame(data, columns=["Y", "D", "S", "Y_1", "Y_0"])
-    df = df.astype({"D": np.int, "S": np.int})
+# The population shares of the cells (S, D) and the means of the potential outcomes (Y_1, Y_0)
+# in each stratum S.
+SHARES_DEMONSTRATION_1 = {
+    (1, 0): 0.36,
+    (2, 0): 0.12,
+    (3, 0): 0.12,
+    (1, 1): 0.08,
+    (2, 1): 0.12,
+    (3, 1): 0.20,
+}
+MEANS_DEMONSTRATION_1 = {1: (4, 2), 2: (8, 6), 3: (14, 10)}
 
-    return df
+
+def get_sample_demonstration_1(num_agents, seed=None):
+    rng = get_rng(seed)
+    return get_sample_strata(SHARES_DEMONSTRATION_1, MEANS_DEMONSTRATION_1, num_agents, rng)
 
 
 def plot_conditional_expectation_demonstration_1(df):
@@ -225,11 +300,12 @@ def plot_conditional_expectation_demonstration_1(df):
 def get_predictions_demonstration_1(df):
 
     df_extend = df.join(pd.get_dummies(df["S"], prefix="S"))
-    df_extend["predict_1"] = smf.ols(formula="Y ~ D + S", data=df_extend).fit().predict()
-    df_extend["predict_2"] = smf.ols(formula="Y ~ D + S_2 + S_3", data=df_extend).fit().predict()
-    df_extend["predict_3"] = (
-        smf.ols(formula="Y ~ D + S_2 + S_3 + S_2 * D + S_3 * D", data=df_extend).fit().predict()
-    )
+
+    # We only need the predictions, which are cached for repeated calls on the same sample.
+    formulas = ["Y ~ D + S", "Y ~ D + S_2 + S_3", "Y ~ D + S_2 + S_3 + S_2 * D + S_3 * D"]
+    predictions = [fit_ols(formula, df_extend, ["fittedvalues"]) for formula in formulas]
+    for i, prediction in enumerate(predictions, 1):
+        df_extend[f"predict_{i}"] = prediction["fittedvalues"]
 
     rslt = dict()
     rslt["observed"] = dict()
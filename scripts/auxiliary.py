@@ -1,22 +1,424 @@
 """This module contains some auxiliary functions shared across the utility scripts."""
 import argparse
 import difflib
+import glob
+import hashlib
+import json
 import os
-import subprocess as sp
+import re
+import shutil
+import threading
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import wait
+from multiprocessing.util import Finalize
 from pathlib import Path
 
+import nbformat
+import psutil
+from jupyter_client import KernelManager
+from nbclient import NotebookClient
+from nbclient.exceptions import CellExecutionError
+from nbconvert import HTMLExporter
+
+from course.datasets import DATASETS
+from course.datasets import get_source_path
+
 PROBLEM_SETS_ROOT = os.environ["PROJECT_ROOT"] + "/problem-sets"
 HANDOUTS_ROOT = os.environ["PROJECT_ROOT"] + "/handouts"
 LECTURES_ROOT = os.environ["PROJECT_ROOT"] + "/lectures"
 DATASETS_ROOT = os.environ["PROJECT_ROOT"] + "/datasets"
 SPECIALS_ROOT = os.environ["PROJECT_ROOT"] + "/specials"
+CACHE_ROOT = os.environ["PROJECT_ROOT"] + "/.cache/notebooks"
+
+# We detect the dependencies of a notebook by simple pattern matching on its code and the code of
+# its local modules. This is sufficient for the way we organize the course material.
+IMPORT_PATTERN = re.compile(r"^\s*(?:from|import)\s+([\w.]+)", re.MULTILINE)
+DATA_PATTERN = re.compile(r"[\"']([^\"'\n]+\.(?:csv|dta|xls|xlsx|parquet|feather))[\"']")
+DATASET_PATTERN = re.compile(r"load_dataset\(\s*[\"'](\w+)[\"']\s*,\s*[\"'](\w+)[\"']")
+
+# Each worker process keeps a kernel alive across notebooks. The kernel imports the heavy libraries
+# once when started, so a notebook only pays for the lookup in `sys.modules`.
+KERNEL_PRELOAD = """
+import importlib
+import warnings
+
+import numpy as np
+
+for module in ["numpy", "pandas", "scipy.stats", "statsmodels.api", "statsmodels.formula.api",
+               "matplotlib.pyplot", "seaborn"]:
+    try:
+        importlib.import_module(module)
+    except ImportError:
+        pass
+
+shell = get_ipython()
+shell.notebook_warnings = warnings.catch_warnings()
+shell.notebook_warnings.__enter__()
+shell.notebook_numpy = {"err": np.geterr(), "printoptions": np.get_printoptions()}
+"""
+
+# Before each notebook, we start from an empty namespace in the notebook's directory. Modules that
+# are part of the project, e.g. the lecture's `auxiliary.py`, are removed from the module cache
+# as they have the same name across lectures. We also restore the process-wide state a notebook
+# might have changed, i.e. the warning filters, the options of pandas and matplotlib, and the
+# global state of NumPy, so the output of a notebook does not depend on the ones run before.
+KERNEL_RESET = """
+import os
+import sys
+import warnings
+
+import matplotlib
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+
+shell = get_ipython()
+shell.notebook_warnings.__exit__(None, None, None)
+shell.notebook_warnings = warnings.catch_warnings()
+shell.notebook_warnings.__enter__()
+
+with warnings.catch_warnings():
+    warnings.simplefilter("ignore")
+    pd.reset_option("all")
+
+np.seterr(**shell.notebook_numpy["err"])
+np.set_printoptions(**shell.notebook_numpy["printoptions"])
+np.random.seed()
+
+plt.close("all")
+matplotlib.rc_file_defaults()
+
+for name, module in list(sys.modules.items()):
+    if (getattr(module, "__file__", None) or "").startswith({project_root!r}):
+        del sys.modules[name]
+
+os.chdir({dirname!r})
+get_ipython().reset(new_session=True)
+"""
+
+KERNEL_MANAGER = dict()
+
+
+def start_kernel():
+    """Start the kernel of a worker process and preload the heavy libraries."""
+    km = KernelManager()
+    km.start_kernel(cwd=os.environ["PROJECT_ROOT"])
+    KERNEL_MANAGER["km"] = km
+
+    execute_silently(km, KERNEL_PRELOAD)
+
+
+def shutdown_kernel():
+    """Shut down the kernel of a worker process."""
+    if KERNEL_MANAGER:
+        KERNEL_MANAGER.pop("km").shutdown_kernel(now=True)
+
+
+def execute_silently(km, code):
+    """Execute code on a kernel without recording it in the kernel's history."""
+    kc = km.client()
+    kc.start_channels()
+    try:
+        kc.wait_for_ready(timeout=60)
+        reply = kc.execute_interactive(code, silent=True, store_history=False)
+    finally:
+        kc.stop_channels()
 
+    if reply["content"]["status"] != "ok":
+        raise AssertionError("unable to execute code on kernel")
 
-def run_notebook(notebook):
-    cmd = " jupyter nbconvert --to html --execute {}  --ExecutePreprocessor.timeout=-1".format(
-        notebook
+
+def init_worker():
+    """Initialize a worker process with a warm kernel."""
+    start_kernel()
+
+    # Workers of a process pool do not run `atexit` handlers, so we register the shutdown with
+    # the finalizers of the `multiprocessing` machinery.
+    Finalize(None, shutdown_kernel, exitpriority=10)
+
+
+def get_kernel(dirname):
+    """Get the worker's kernel with a clean namespace in the requested directory."""
+    if not KERNEL_MANAGER or not KERNEL_MANAGER["km"].is_alive():
+        start_kernel()
+
+    km = KERNEL_MANAGER["km"]
+    execute_silently(
+        km, KERNEL_RESET.format(project_root=os.environ["PROJECT_ROOT"], dirname=dirname)
     )
-    sp.check_call(cmd, shell=True)
+
+    return km
+
+
+def get_kernel_pid(km):
+    """Get the process identifier of a kernel."""
+    # The kernel's process moved to the provisioner in version 7 of `jupyter_client`.
+    if hasattr(km, "provisioner"):
+        return km.provisioner.pid
+    return km.kernel.pid
+
+
+def attach_profiler(client):
+    """Record the wall time and peak memory of each cell executed by the client.
+
+    We poll the resident set size of the kernel's process in a background thread while a cell is
+    executed, as the high-water mark of the process covers all notebooks the kernel has executed.
+    The function returns the list that is filled with a record for each cell and a function to
+    stop sampling in case the execution is aborted.
+    """
+    process = psutil.Process(get_kernel_pid(client.km))
+    profile, state = list(), dict()
+
+    def sample_memory(stop):
+        while not stop.wait(0.01):
+            state["peak"] = max(state["peak"], process.memory_info().rss)
+
+    def stop_sampling():
+        if "stop" in state:
+            state.pop("stop").set()
+            state.pop("thread").join()
+
+    def on_cell_execute(cell, cell_index):
+        state["start"], state["peak"] = time.perf_counter(), process.memory_info().rss
+        state["stop"] = threading.Event()
+        state["thread"] = threading.Thread(target=sample_memory, args=(state["stop"],))
+        state["thread"].start()
+
+    def on_cell_executed(cell, cell_index, execute_reply):
+        stop_sampling()
+        state["peak"] = max(state["peak"], process.memory_info().rss)
+
+        record = dict()
+        record["cell"] = cell_index
+        record["source"] = cell.source.strip().split("\n")[0]
+        record["wall_time"] = time.perf_counter() - state["start"]
+        record["peak_rss"] = state["peak"] / 1024**2
+        profile.append(record)
+
+    client.on_cell_execute = on_cell_execute
+    client.on_cell_executed = on_cell_executed
+
+    return profile, stop_sampling
+
+
+def run_notebook(notebook, force=False):
+    """Execute a single notebook in its own directory.
+
+    The notebook is executed on the warm kernel of the worker process, which is moved to the
+    notebook's directory first. So several notebooks can run side by side without changing the
+    working directory of the calling process. Errors are captured and returned to allow for
+    reporting per notebook.
+
+    The exported HTML is stored in a cache keyed on the content of the notebook and all its inputs.
+    We reuse it instead of executing the notebook again unless a rerun is forced. The cache also
+    holds a report with the wall time (in seconds) and peak memory (in MB) of each cell.
+    """
+    dirname, fname = os.path.split(os.path.abspath(notebook))
+    fname_html = fname.replace(".ipynb", ".html")
+    cache_dir = f"{CACHE_ROOT}/{get_notebook_hash(notebook)}"
+
+    start = time.time()
+    if not force and os.path.exists(f"{cache_dir}/{fname_html}"):
+        shutil.copy(f"{cache_dir}/{fname_html}", f"{dirname}/{fname_html}")
+        return "cached", "", time.time() - start
+
+    nb = nbformat.read(notebook, as_version=4)
+    resources = {"metadata": {"path": dirname}}
+
+    client, stop_sampling = None, None
+    try:
+        client = NotebookClient(nb, km=get_kernel(dirname), timeout=None, resources=resources)
+        profile, stop_sampling = attach_profiler(client)
+        client.execute()
+    except (AssertionError, CellExecutionError, RuntimeError) as e:
+        # We do not want to carry a kernel in an unknown state over to the next notebook.
+        shutdown_kernel()
+        return "failure", str(e), time.time() - start
+    finally:
+        if stop_sampling is not None:
+            stop_sampling()
+        if client is not None and client.kc is not None:
+            client.kc.stop_channels()
+
+    html, _ = HTMLExporter().from_notebook_node(nb, resources=resources)
+    with open(f"{dirname}/{fname_html}", "w") as outfile:
+        outfile.write(html)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    shutil.copy(f"{dirname}/{fname_html}", f"{cache_dir}/{fname_html}")
+    with open(f"{cache_dir}/{fname.replace('.ipynb', '.json')}", "w") as outfile:
+        json.dump(profile, outfile, indent=4)
+
+    return "success", "", time.time() - start
+
+
+def print_profile(notebooks, num_cells=10):
+    """Print the slowest cells across all notebooks based on their latest report."""
+    cells = list()
+    for notebook in notebooks:
+        fname = os.path.basename(notebook).replace(".ipynb", ".json")
+        fname = f"{CACHE_ROOT}/{get_notebook_hash(notebook)}/{fname}"
+        if not os.path.exists(fname):
+            continue
+
+        with open(fname) as infile:
+            for record in json.load(infile):
+                record["notebook"] = os.path.relpath(notebook, os.environ["PROJECT_ROOT"])
+                cells.append(record)
+
+    cells.sort(key=lambda record: record["wall_time"], reverse=True)
+
+    print(f"\n {'Time (s)':>10} {'Memory (MB)':>12}  Cell\n")
+    for record in cells[:num_cells]:
+        print(f" {record['wall_time']:10.2f} {record['peak_rss']:12.1f}  ", end="")
+        print(f"{record['notebook']}:{record['cell']}  {record['source'][:60]}")
+
+
+def run_task_graph(graph, num_jobs=1, initializer=None):
+    """Execute a graph of tasks in a pool of worker processes.
+
+    The graph maps the name of each task to a tuple of the function, its arguments, and the set of
+    tasks it depends on. A task is submitted as soon as all its dependencies succeeded, so
+    independent tasks run concurrently. Tasks downstream of a failure are skipped. We report the
+    outcome for each task as soon as it is available and only raise an error once the graph is
+    processed, so a single failure does not hide the others. Any error raised while submitting a
+    task or collecting its result, e.g. as a worker's kernel failed to start, counts as a failure
+    of the task with the traceback as its log. The initializer is called once in each worker
+    process.
+    """
+    if not graph:
+        return
+
+    num_workers = min(num_jobs if num_jobs > 0 else os.cpu_count(), len(graph))
+
+    remaining, running = dict(graph), dict()
+    succeeded, failed, skipped = set(), set(), set()
+    with ProcessPoolExecutor(max_workers=num_workers, initializer=initializer) as executor:
+        while remaining or running:
+            for name, (func, args, dependencies) in sorted(remaining.items()):
+                if dependencies & (failed | skipped):
+                    print(f"\n {name}: skipped\n")
+                    skipped.add(name)
+                elif dependencies <= succeeded:
+                    try:
+                        running[executor.submit(func, *args)] = (name, time.time())
+                    except Exception:
+                        report_task(name, "failure", traceback.format_exc(), 0.0)
+                        failed.add(name)
+                else:
+                    continue
+                del remaining[name]
+
+            if not running:
+                if not remaining:
+                    break
+                # Tasks downstream of a failure in this pass are skipped in the next one.
+                if not any(deps & (failed | skipped) for _, _, deps in remaining.values()):
+                    raise AssertionError(
+                        "unable to resolve dependencies of " + ", ".join(remaining)
+                    )
+                continue
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name, start = running.pop(future)
+                try:
+                    status, log, duration = future.result()
+                except Exception:
+                    status, log, duration = "failure", traceback.format_exc(), time.time() - start
+
+                report_task(name, status, log, duration)
+                if status == "failure":
+                    failed.add(name)
+                else:
+                    succeeded.add(name)
+
+    if failed or skipped:
+        raise AssertionError("unable to execute " + ", ".join(sorted(failed | skipped)))
+
+
+def report_task(name, status, log, duration):
+    """Report the outcome of a task, including its log for a failure."""
+    print(f"\n {name}: {status} ({duration:.1f}s)\n")
+    if status == "failure":
+        print(log)
+
+
+def run_notebooks(notebooks, num_jobs=1, force=False):
+    """Execute independent notebooks in a pool of worker processes."""
+    graph = dict()
+    for notebook in notebooks:
+        name = os.path.relpath(notebook, os.environ["PROJECT_ROOT"])
+        graph[name] = (run_notebook, (notebook, force), set())
+
+    run_task_graph(graph, num_jobs, init_worker)
+
+
+def get_notebook_inputs(notebook):
+    """Get the local modules and data files a notebook depends on.
+
+    We follow the imports of modules that live next to the notebook, e.g. the lecture's
+    ``auxiliary.py``, or in the project's root, e.g. the shared ``course`` package. We collect all
+    data files referenced in the notebook or these modules that exist relative to the notebook's
+    directory as well as the sources of all datasets requested from the shared loader.
+    """
+    dirname = os.path.dirname(os.path.abspath(notebook))
+
+    with open(notebook) as infile:
+        cells = json.load(infile)["cells"]
+    sources = ["".join(cell["source"]) for cell in cells if cell["cell_type"] == "code"]
+
+    modules, data = set(), set()
+    while sources:
+        source = sources.pop()
+        for name in IMPORT_PATTERN.findall(source):
+            path = name.replace(".", "/")
+            for root in [dirname, os.environ["PROJECT_ROOT"]]:
+                for fname in [f"{root}/{path}.py", f"{root}/{path}/__init__.py"]:
+                    if os.path.exists(fname) and fname not in modules:
+                        modules.add(fname)
+                        with open(fname) as infile:
+                            sources.append(infile.read())
+
+        for path in DATA_PATTERN.findall(source):
+            fname = os.path.normpath(f"{dirname}/{path}")
+            if os.path.exists(fname):
+                data.add(fname)
+
+        # The loader builds the processed datasets from their tracked sources.
+        for textbook, dataset in DATASET_PATTERN.findall(source):
+            name = f"{textbook}/{dataset}"
+            if name in DATASETS:
+                data.add(str(get_source_path(name)))
+
+    return sorted(modules), sorted(data)
+
+
+def get_notebook_hash(notebook):
+    """Get a hash of the notebook's source and all its inputs."""
+    modules, data = get_notebook_inputs(notebook)
+
+    hash_ = hashlib.sha256()
+    for fname in [os.path.abspath(notebook)] + modules + data:
+        hash_.update(os.path.relpath(fname, os.environ["PROJECT_ROOT"]).encode())
+        with open(fname, "rb") as infile:
+            hash_.update(infile.read())
+
+    return hash_.hexdigest()
+
+
+def get_notebooks(task_dir, request=None):
+    """Collect the notebooks of the requested tasks as absolute paths."""
+    dirnames = [task_dir] if request is None else [f"{task_dir}/{name}" for name in request]
+
+    notebooks = list()
+    for dirname in dirnames:
+        notebooks += sorted(glob.glob(f"{dirname}/*.ipynb"))
+
+    return notebooks
 
 
 def parse_arguments(description):
@@ -38,6 +440,33 @@ def parse_arguments(description):
         "-n", "--name", type=str, help=f"name of {task}", default="all", dest="name"
     )
 
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        help="number of notebooks executed in parallel, 0 uses all cores",
+        default=1,
+        dest="jobs",
+    )
+
+    parser.add_argument(
+        "-f",
+        "--force",
+        action="store_true",
+        help="execute notebooks even if their cached output is up to date",
+        dest="force",
+    )
+
+    parser.add_argument(
+        "-p",
+        "--profile",
+        type=int,
+        nargs="?",
+        const=10,
+        help="print the given number of slowest cells, defaults to ten",
+        dest="profile",
+    )
+
     args = parser.parse_args()
 
     # We can either request a single lecture or just act on all of them. We use string matching
@@ -50,7 +479,7 @@ def parse_arguments(description):
         request = get_list_tasks(task_dir)
     request.sort()
 
-    return request
+    return request, args
 
 
 def get_list_tasks(task_dir):
@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+"""Run benchmarks.
+
+This script times the data-generating and estimation helpers of the lectures across a ladder of
+problem sizes. It reports the scaling exponent of each helper, i.e. the slope of the runtime in
+the problem size on a log-log scale, and compares the runtimes against a stored baseline.
+
+The timings depend on the machine, so the baseline is a local file in ``.cache`` that is recorded
+with ``--save`` before a change and checked against after it. The runtimes of small problems are
+dominated by noise. We therefore repeat each call until a measurement takes a minimum time and
+only flag regressions on the largest sizes of each ladder.
+
+Examples
+--------
+>> run-benchmark                 Run all benchmarks and compare them against the baseline.
+
+>> run-benchmark -n quick        Run the benchmark of get_quick_sample.
+
+>> run-benchmark --save          Run all benchmarks and store the results as the new baseline.
+"""
+import argparse
+import importlib.util
+import json
+import os
+import time
+
+import numpy as np
+from auxiliary import LECTURES_ROOT
+
+BASELINE = os.environ["PROJECT_ROOT"] + "/.cache/benchmarks.json"
+
+# Each measurement calls a helper as often as needed to take at least this time (in seconds).
+MIN_TIME = 0.2
+
+# We only flag regressions on this number of the largest sizes in each ladder.
+NUM_GATED = 2
+
+# Each benchmark calls a helper from the auxiliary module of a lecture for each size in its ladder.
+BENCHMARKS = dict()
+
+BENCHMARKS["get_sample_panel_demonstration"] = {
+    "lecture": "repeated-observations",
+    "run": lambda func, size: func(size, "baseline", "parallel"),
+    "sizes": [1000, 10000, 100000, 1000000],
+}
+
+BENCHMARKS["get_sample_matching_demonstration_3"] = {
+    "lecture": "matching-estimators",
+    "run": lambda func, size: func(np.linspace(0, 1, size), np.linspace(0, 1, size)),
+    "sizes": [100, 300, 1000],
+}
+
+BENCHMARKS["get_sample_matching_demonstration_2"] = {
+    "lecture": "matching-estimators",
+    "run": lambda func, size: func(size),
+    "sizes": [1000, 10000, 100000, 1000000],
+}
+
+BENCHMARKS["get_sample_regression_adjustment"] = {
+    "lecture": "regression-estimators",
+    "run": lambda func, size: func(0, size),
+    "sizes": [1000, 10000, 100000, 1000000],
+}
+
+BENCHMARKS["get_quick_sample"] = {
+    "lecture": "regression-estimators",
+    "run": lambda func, size: func(size),
+    "sizes": [1000, 10000, 100000, 1000000],
+}
+
+BENCHMARKS["get_sample_demonstration_1"] = {
+    "lecture": "regression-estimators",
+    "run": lambda func, size: func(size),
+    "sizes": [1000, 10000, 100000, 1000000],
+}
+
+BENCHMARKS["run_freedman_exercise"] = {
+    "lecture": "regression-estimators",
+    "run": lambda func, size: [func() for _ in range(size)],
+    "sizes": [1, 5, 10],
+}
+
+BENCHMARKS["run_freedman_exercises"] = {
+    "lecture": "regression-estimators",
+    "run": lambda func, size: func(size),
+    "sizes": [100, 1000, 10000],
+}
+
+BENCHMARKS["observed_outcome"] = {
+    "lecture": "regression-discontinuity",
+    "run": lambda func, size: func(np.linspace(0, 1, size), "fuzzy"),
+    "sizes": [1000, 10000, 100000, 1000000],
+}
+
+
+def get_function(lecture, name):
+    """Get a function from the auxiliary module of a lecture."""
+    # All modules share the name `auxiliary`, so we load each under a name of its own.
+    fname = f"{LECTURES_ROOT}/{lecture}/auxiliary.py"
+    spec = importlib.util.spec_from_file_location(f"{lecture.replace('-', '_')}_auxiliary", fname)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    return getattr(module, name)
+
+
+def time_function(run, func, size, num_repeats):
+    """Get the best runtime of a call over several repetitions.
+
+    Each repetition calls the function as often as needed to take at least ``MIN_TIME`` seconds,
+    so the runtime of fast calls is not dominated by the resolution of the timer and other noise.
+    """
+    timings = list()
+    for _ in range(num_repeats):
+        num_calls, elapsed = 0, 0.0
+        while elapsed < MIN_TIME:
+            np.random.seed(123)
+            start = time.perf_counter()
+            run(func, size)
+            elapsed += time.perf_counter() - start
+            num_calls += 1
+        timings.append(elapsed / num_calls)
+
+    return min(timings)
+
+
+def run_benchmark(name, num_repeats):
+    """Run a single benchmark across its ladder of sizes."""
+    spec = BENCHMARKS[name]
+    func = get_function(spec["lecture"], name)
+
+    rslt = dict()
+    for size in spec["sizes"]:
+        rslt[str(size)] = time_function(spec["run"], func, size, num_repeats)
+
+    return rslt
+
+
+def get_scaling_exponent(rslt):
+    """Get the slope of the runtime in the problem size on a log-log scale."""
+    if len(rslt) < 2:
+        return np.nan
+    sizes, timings = np.array([int(size) for size in rslt]), np.array(list(rslt.values()))
+    return np.polyfit(np.log(sizes), np.log(timings), 1)[0]
+
+
+def report_benchmark(name, rslt, baseline, tolerance):
+    """Print the results of a benchmark and get the sizes that regressed."""
+    print(f"\n {name}\n")
+    print(f" {'Size':>10} {'Time (s)':>12} {'Baseline (s)':>14}")
+
+    gated = list(rslt)[-NUM_GATED:]
+
+    regressions = list()
+    for size, timing in rslt.items():
+        reference = baseline.get(name, dict()).get(size, np.nan)
+        is_regression = size in gated and timing > reference * (1 + tolerance)
+        print(f" {size:>10} {timing:12.4f} {reference:14.4f}" + ("  *" if is_regression else ""))
+
+        if is_regression:
+            regressions.append(f"{name} ({size})")
+
+    print(f"\n Scaling exponent: {get_scaling_exponent(rslt):.2f}")
+
+    return regressions
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Run benchmarks")
+    parser.add_argument("-n", "--name", type=str, help="name of benchmark", default="all")
+    parser.add_argument(
+        "-r", "--repeat", type=int, help="number of repetitions per size", default=3
+    )
+    parser.add_argument(
+        "-t",
+        "--tolerance",
+        type=float,
+        help="relative slowdown on the largest sizes that counts as a regression",
+        default=0.5,
+    )
+    parser.add_argument("--baseline", type=str, help="path of the baseline", default=BASELINE)
+    parser.add_argument("--save", action="store_true", help="store results as the new baseline")
+    args = parser.parse_args()
+
+    names = [name for name in BENCHMARKS if args.name == "all" or args.name in name]
+    if not names:
+        raise AssertionError("unable to match benchmark")
+
+    baseline = dict()
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as infile:
+            baseline = json.load(infile)
+
+    regressions = list()
+    for name in names:
+        rslt = run_benchmark(name, args.repeat)
+        regressions += report_benchmark(name, rslt, baseline, args.tolerance)
+        baseline[name] = rslt
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, "w") as outfile:
+            json.dump(baseline, outfile, indent=4)
+            outfile.write("\n")
+    elif regressions:
+        raise AssertionError("performance regression in " + ", ".join(regressions))
@@ -1,48 +1,84 @@
 #!/usr/bin/env python
+"""Run datasets.
+
+This script processes the datasets from their original sources. Each dataset is declared in the
+table of ``course.datasets`` with its source and the function to read it, so a new dataset only
+needs an entry in the table. A dataset is only processed again if its source or its processing
+changed since the last run.
+
+We store each dataset as a csv file for students and as a compressed parquet file that preserves
+the data types, including the labels of categorical variables, which the notebooks read with
+``course.datasets.load_dataset``. The loader also builds an outdated parquet file on its own.
+
+Examples
+--------
+>> run-dataset           Process all datasets that changed.
+
+>> run-dataset -j 4      Process all datasets that changed, four at a time.
+
+>> run-dataset -f        Process all datasets.
+"""
+import argparse
 import os
-from itertools import product
+import time
 
-import pandas as pd
 from auxiliary import DATASETS_ROOT
+from auxiliary import run_task_graph
+
+from course.datasets import DATASETS
+from course.datasets import get_source_hash
+from course.datasets import is_dataset_current
+from course.datasets import read_source
+from course.datasets import write_dataset
+
+STAMPS_ROOT = os.environ["PROJECT_ROOT"] + "/.cache/datasets"
+
+
+def process_dataset(name, force=False):
+    """Process a single dataset unless it is up to date."""
+    fname_processed = f"{DATASETS_ROOT}/processed/{name}"
+    fname_stamp = f"{STAMPS_ROOT}/{name}.sha256"
 
+    start, hash_ = time.time(), get_source_hash(name)
+    is_processed = os.path.exists(f"{fname_processed}.csv") and is_dataset_current(name)
+    if not force and is_processed and os.path.exists(fname_stamp):
+        with open(fname_stamp) as infile:
+            if infile.read() == hash_:
+                return "cached", "", time.time() - start
 
-def from_dta_to_csv(textbook, dataset):
-    """Transfer the dataset from *.dta to a csv file."""
-    substring = textbook + "/" + dataset
-    df = pd.read_stata("sources/" + substring + ".dta")
-    df.to_csv("processed/" + substring + ".csv", index=False)
-    return df
+    try:
+        df = read_source(name)
+        os.makedirs(os.path.dirname(fname_processed), exist_ok=True)
+        df.to_csv(f"{fname_processed}.csv", index=False)
+        write_dataset(name, df)
+    except (OSError, ValueError) as e:
+        return "failure", str(e), time.time() - start
 
+    os.makedirs(os.path.dirname(fname_stamp), exist_ok=True)
+    with open(fname_stamp, "w") as outfile:
+        outfile.write(hash_)
 
-os.chdir(DATASETS_ROOT)
+    return "success", "", time.time() - start
 
-# This is a  cross-sectional dataset on low birth weight from the Wooldrige textbook.
-df = from_dta_to_csv("wooldrige", "lowbrth")
 
-# Lee (2008), regression discontinuity design, https://rdrr.io/cran/rddtools/man/house.html,
-# required transferred the `rda` file manually to `csv`.
-df = pd.read_csv("sources/msc/house.csv", index_col=0)
+def get_task_graph(force=False):
+    """Get the graph of tasks to process all datasets."""
+    graph = dict()
+    for name in DATASETS:
+        graph[f"datasets/processed/{name}"] = (process_dataset, (name, force), set())
 
-# We want more interpretable column names.
-df.rename(columns={"x": "vote_last", "y": "vote_next"}, inplace=True)
-df.to_csv("processed/msc/house.csv", index=False)
+    return graph
 
-# Krueger (1999), STAR experiment, clustering on group level. There was a lot of pre-processing
-# required using the replication material from the MHE website.
-df = from_dta_to_csv("angrist_pischke", "webstar")
-df.head()
 
-# Morgan & Winship, these are the datasets for the matching illustration in Chapter 5.
-for num in range(1, 11):
-    fname = f"mw_cath{num}"
-    df = from_dta_to_csv("morgan_winship", fname)
+if __name__ == "__main__":
 
-# All data related to LaLonde (1986) and Dehejia and Waba (1999) is available on the following
-# NBER website: https://users.nber.org/~rdehejia/nswdata.html. The sample originally used by
-# LaLonde is larger as it does not require information on earnings in 1974, while this is used
-# as a pre-treatment variable in the follow-up work.
-from_dta_to_csv("dehejia_waba", "nsw_lalonde")
+    parser = argparse.ArgumentParser(description="Process datasets")
+    parser.add_argument(
+        "-j", "--jobs", type=int, help="number of datasets processed in parallel", default=1
+    )
+    parser.add_argument(
+        "-f", "--force", action="store_true", help="process datasets even if they are up to date"
+    )
+    args = parser.parse_args()
 
-from_dta_to_csv("dehejia_waba", "nsw_dehejia")
-for source, num in product(["psid", "cps"], range(1, 4)):
-    from_dta_to_csv("dehejia_waba", f"{source}_controls{num}")
+    run_task_graph(get_task_graph(args.force), args.jobs)
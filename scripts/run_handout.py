@@ -9,19 +9,21 @@ Examples
 >> run-special             Run all specials.
 
 >> run-special -n 01      Run special nonstandard-standard_errors.
-"""
-import glob
-import os
 
+>> run-handout -j 4        Run all handouts, four at a time.
+"""
+from auxiliary import get_notebooks
 from auxiliary import HANDOUTS_ROOT
 from auxiliary import parse_arguments
-from auxiliary import run_notebook
+from auxiliary import print_profile
+from auxiliary import run_notebooks
 
 if __name__ == "__main__":
 
-    request = parse_arguments("Execute handouts")
-    os.chdir(HANDOUTS_ROOT)
+    _, args = parse_arguments("Execute handouts")
+
+    notebooks = get_notebooks(HANDOUTS_ROOT)
+    run_notebooks(notebooks, args.jobs, args.force)
 
-    for fname in glob.glob("*.ipynb"):
-        print(f"\n {os.getcwd().split('/')[-1]}\n")
-        run_notebook(fname)
+    if args.profile:
+        print_profile(notebooks, args.profile)
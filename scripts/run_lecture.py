@@ -9,24 +9,24 @@ Examples
 >> run-notebook             Run all lectures.
 
 >> run-notebook -n 01      Run lecture 01-introduction.
-"""
-import glob
-import os
 
+>> run-notebook -j 4        Run all lectures, four at a time.
+
+>> run-notebook -p 5        Run all lectures and print the five slowest cells.
+"""
+from auxiliary import get_notebooks
 from auxiliary import LECTURES_ROOT
 from auxiliary import parse_arguments
-from auxiliary import run_notebook
+from auxiliary import print_profile
+from auxiliary import run_notebooks
 
 
 if __name__ == "__main__":
 
-    request = parse_arguments("Execute notebook")
-    os.chdir(LECTURES_ROOT)
+    request, args = parse_arguments("Execute notebook")
 
-    for dirname in request:
+    notebooks = get_notebooks(LECTURES_ROOT, request)
+    run_notebooks(notebooks, args.jobs, args.force)
 
-        os.chdir(dirname)
-        for fname in glob.glob("*.ipynb"):
-            print(f"\n {os.getcwd().split('/')[-1]}\n")
-            run_notebook(fname)
-        os.chdir("../")
+    if args.profile:
+        print_profile(notebooks, args.profile)
@@ -9,23 +9,22 @@ Examples
 >> run-problem             Run all problem set.
 
 >> run-problem -n 01      Run slide 01-potential-outcome-model.
-"""
-import glob
-import os
 
+>> run-problem -j 4        Run all problem sets, four at a time.
+"""
+from auxiliary import get_notebooks
 from auxiliary import parse_arguments
+from auxiliary import print_profile
 from auxiliary import PROBLEM_SETS_ROOT
-from auxiliary import run_notebook
+from auxiliary import run_notebooks
 
 
 if __name__ == "__main__":
 
-    request = parse_arguments("Create problem set")
-
-    os.chdir(PROBLEM_SETS_ROOT)
+    request, args = parse_arguments("Create problem set")
 
-    for dirname in request:
-        os.chdir(dirname)
-        [run_notebook(fname) for fname in glob.glob("*.ipynb")]
+    notebooks = get_notebooks(PROBLEM_SETS_ROOT, request)
+    run_notebooks(notebooks, args.jobs, args.force)
 
-        os.chdir("../")
+    if args.profile:
+        print_profile(notebooks, args.profile)
@@ -1,15 +1,81 @@
 #!/usr/bin/env python
 """Run project.
 
-This script allows to run the whole project. It simply calls the other scripts tailored to run
-the slides, notebooks, problem sets, handouts, and data.
+This script allows to run the whole project. It executes the notebooks of the lectures, problem
+sets, and handouts as well as the data processing as one graph of tasks. Each processed dataset
+is a dependency of all notebooks that read it, while all other tasks run concurrently. The
+lectures' own modules and data are part of the cache key of their notebooks, so only the
+notebooks downstream of a change are executed again.
 
 Examples
 --------
 >> run-project           Run all notebooks, problems sets, handouts, data, and specials.
 
+>> run-project -j 4      Run the project with four tasks at a time.
+
+>> run-project -f        Run all notebooks, even those with up-to-date cached output.
+
+>> run-project -p        Run the project and print the ten slowest cells.
+
 """
-import subprocess as sp
+import argparse
+import os
+
+from auxiliary import get_list_tasks
+from auxiliary import get_notebook_inputs
+from auxiliary import get_notebooks
+from auxiliary import HANDOUTS_ROOT
+from auxiliary import init_worker
+from auxiliary import LECTURES_ROOT
+from auxiliary import print_profile
+from auxiliary import PROBLEM_SETS_ROOT
+from auxiliary import run_notebook
+from auxiliary import run_task_graph
+from run_dataset import get_task_graph as get_task_graph_datasets
+
+
+def get_task_graph(force):
+    """Get the graph of all tasks in the project."""
+    graph = get_task_graph_datasets(force)
+
+    notebooks = list()
+    for task_dir in [LECTURES_ROOT, PROBLEM_SETS_ROOT]:
+        notebooks += get_notebooks(task_dir, sorted(get_list_tasks(task_dir)))
+    notebooks += get_notebooks(HANDOUTS_ROOT)
+
+    for notebook in notebooks:
+        _, data = get_notebook_inputs(notebook)
+
+        # The tasks of the datasets are named after the processed files without their extension.
+        data = [os.path.relpath(fname, os.environ["PROJECT_ROOT"]) for fname in data]
+        dependencies = {os.path.splitext(fname)[0] for fname in data} & set(graph)
+
+        name = os.path.relpath(notebook, os.environ["PROJECT_ROOT"])
+        graph[name] = (run_notebook, (notebook, force), dependencies)
+
+    return graph
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Run project")
+    parser.add_argument(
+        "-j", "--jobs", type=int, help="number of tasks executed in parallel", default=1
+    )
+    parser.add_argument(
+        "-f",
+        "--force",
+        action="store_true",
+        help="execute notebooks even if their output is cached",
+    )
+    parser.add_argument(
+        "-p", "--profile", type=int, nargs="?", const=10, help="print the slowest cells"
+    )
+    args = parser.parse_args()
+
+    graph = get_task_graph(args.force)
+    run_task_graph(graph, args.jobs, init_worker)
 
-tasks = ["lecture", "problem", "dataset", "handout"]
-[sp.check_call(f"run-{task}") for task in tasks]
+    if args.profile:
+        notebooks = [task[1][0] for task in graph.values() if task[0] == run_notebook]
+        print_profile(notebooks, args.profile)
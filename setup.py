@@ -0,0 +1,10 @@
+from setuptools import find_packages
+from setuptools import setup
+
+setup(
+    name="ose-course-data-science",
+    version="0.0.1",
+    description="Functionality shared across the lectures of the course.",
+    packages=find_packages(include=["course", "course.*"]),
+    python_requires=">=3.7",
+)
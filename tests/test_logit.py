@@ -0,0 +1,86 @@
+"""Tests for the logit estimator against statsmodels on the NSW and CPS data."""
+import numpy as np
+import pandas as pd
+import pytest
+import statsmodels.api as sm
+
+from course.datasets import load_dataset
+from course.logit import fit_logit
+from course.matching import get_matching_estimate
+from course.matching import get_propensity_matching_estimates
+
+COVARIATES = ["age", "education", "black", "hispanic", "married", "nodegree", "re74", "re75"]
+
+
+def get_lalonde_design():
+    """Get the treated units of the NSW experiment together with the CPS controls."""
+    nsw = load_dataset("dehejia_waba", "nsw_dehejia", filters=[("treat", "==", 1)])
+    nsw = nsw.rename(columns={"ed": "education", "hisp": "hispanic", "nodeg": "nodegree"})
+    cps = load_dataset("dehejia_waba", "cps_controls1")
+
+    columns = ["re78", "treat"] + COVARIATES
+    df = pd.concat([nsw[columns], cps[columns]], ignore_index=True)
+
+    y, d = df["re78"].to_numpy(float), df["treat"].to_numpy(float)
+    exog = np.column_stack((np.ones(len(df)), df[COVARIATES].to_numpy(float)))
+
+    return y, d, exog
+
+
+def get_separated_indices(d, exog, num_obs, rng):
+    """Get a sample, where having no degree perfectly predicts the treatment."""
+    is_separated = (d == 1) == (exog[:, COVARIATES.index("nodegree") + 1] == 1)
+    return rng.choice(np.flatnonzero(is_separated), size=num_obs)
+
+
+def test_logit_statsmodels():
+    _, d, exog = get_lalonde_design()
+
+    rslt = fit_logit(d, exog)
+    expected = sm.Logit(d, exog).fit(disp=0)
+
+    assert expected.mle_retvals["converged"]
+    np.testing.assert_allclose(rslt["params"], expected.params, rtol=1e-12)
+    np.testing.assert_allclose(rslt["bse"], expected.bse, rtol=1e-12)
+    np.testing.assert_allclose(rslt["predict"], expected.predict(), rtol=1e-12)
+
+
+def test_logit_batch():
+    _, d, exog = get_lalonde_design()
+    indices = np.random.default_rng(123).integers(len(d), size=(3, len(d)))
+
+    rslt = fit_logit(d[indices], exog[indices])
+
+    for i, idx in enumerate(indices):
+        expected = fit_logit(d[idx], exog[idx])
+        for key in ["params", "bse", "predict"]:
+            np.testing.assert_allclose(rslt[key][i], expected[key], rtol=1e-10)
+
+
+def test_logit_separation():
+    _, d, exog = get_lalonde_design()
+    idx = get_separated_indices(d, exog, len(d), np.random.default_rng(123))
+
+    with pytest.raises(AssertionError):
+        fit_logit(d[idx], exog[idx])
+
+
+def test_propensity_matching_estimates_separation():
+    y, d, exog = get_lalonde_design()
+    start_params = fit_logit(d, exog)["params"]
+
+    rng = np.random.default_rng(123)
+    indices = rng.integers(len(d), size=(3, len(d)))
+    indices[1] = get_separated_indices(d, exog, len(d), rng)
+
+    # The batched fit fails for the separated sample, so all samples are fitted separately.
+    with pytest.raises(AssertionError):
+        fit_logit(d[indices], exog[indices], start_params)
+
+    rslt = get_propensity_matching_estimates(y, d, exog, start_params, indices)
+
+    assert np.isnan(rslt[1])
+    for i in [0, 2]:
+        idx = indices[i]
+        score = fit_logit(d[idx], exog[idx], start_params, predictions_only=True)
+        assert rslt[i] == get_matching_estimate(y[idx], d[idx], score)
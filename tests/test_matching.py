@@ -0,0 +1,84 @@
+"""Tests for the matching on a score and on the covariates against a brute-force search."""
+import numpy as np
+import pytest
+from scipy.spatial.distance import cdist
+
+from course.matching import get_covariate_neighbors
+from course.matching import get_neighbors
+
+
+def get_neighbors_brute_force(score, score_pool, num_neighbors, caliper, replacement):
+    neighbors = np.full((len(score), num_neighbors), -1)
+    is_available = np.ones(len(score_pool), dtype=bool)
+
+    order = range(len(score)) if replacement else np.argsort(-score, kind="stable")
+    for i in order:
+        distance = np.where(is_available, np.abs(score_pool - score[i]), np.inf)
+        for j, match in enumerate(np.argsort(distance, kind="stable")[:num_neighbors]):
+            if np.isinf(distance[match]):
+                break
+            if caliper is not None and distance[match] > caliper:
+                break
+            neighbors[i, j] = match
+            if not replacement:
+                is_available[match] = False
+
+    return neighbors
+
+
+def test_neighbors_caliper_without_replacement():
+    neighbors = get_neighbors([0.9, 0.5], [0.55], caliper=0.1, replacement=False)
+    np.testing.assert_array_equal(neighbors, [[-1], [0]])
+
+
+@pytest.mark.parametrize("replacement", [True, False])
+@pytest.mark.parametrize("caliper", [None, 0.01, 0.05])
+@pytest.mark.parametrize("num_neighbors", [1, 3])
+def test_neighbors_brute_force(num_neighbors, caliper, replacement):
+    rng = np.random.default_rng(123)
+
+    for _ in range(50):
+        num_units, num_pool = rng.integers(1, 40, size=2)
+        score, score_pool = rng.uniform(size=num_units), rng.uniform(size=num_pool)
+
+        rslt = get_neighbors(score, score_pool, num_neighbors, caliper, replacement)
+        expected = get_neighbors_brute_force(score, score_pool, num_neighbors, caliper, replacement)
+
+        np.testing.assert_array_equal(rslt, expected)
+
+
+def get_covariate_neighbors_brute_force(x, x_pool, num_neighbors, radius):
+    inverse = np.linalg.inv(np.atleast_2d(np.cov(np.concatenate((x, x_pool)), rowvar=False)))
+    distance = cdist(x, x_pool, metric="mahalanobis", VI=inverse)
+    if radius is not None:
+        distance[distance > radius] = np.inf
+
+    if num_neighbors is None:
+        num_neighbors = int(np.isfinite(distance).sum(axis=1).max(initial=0))
+
+    neighbors = np.full((len(x), num_neighbors), -1)
+    for i in range(len(x)):
+        for j, match in enumerate(np.argsort(distance[i], kind="stable")[:num_neighbors]):
+            if np.isinf(distance[i, match]):
+                break
+            neighbors[i, j] = match
+
+    return neighbors
+
+
+@pytest.mark.parametrize(
+    "num_neighbors, radius", [(1, None), (3, None), (1, 0.5), (3, 1.5), (None, 0.5), (None, 1.5)]
+)
+def test_covariate_neighbors_brute_force(num_neighbors, radius):
+    rng = np.random.default_rng(123)
+
+    for _ in range(50):
+        num_units, num_pool = rng.integers(2, 40, size=2)
+        num_covariates = rng.integers(1, 4)
+        x = rng.normal(size=(num_units, num_covariates))
+        x_pool = rng.normal(size=(num_pool, num_covariates))
+
+        rslt = get_covariate_neighbors(x, x_pool, num_neighbors, radius, batch_size=7)
+        expected = get_covariate_neighbors_brute_force(x, x_pool, num_neighbors, radius)
+
+        np.testing.assert_array_equal(rslt, expected)